@@ -1 +1,5 @@
 # Backend package
+from dotenv import load_dotenv
+
+# Modules read their settings from the environment at import; load .env once, here.
+load_dotenv()
@@ -1,51 +1,103 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException
 from datetime import datetime
-from pymongo import MongoClient
-import os
-import smtplib
-from email.mime.text import MIMEText
-from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, DeleteMany, UpdateMany
+import asyncio, os, re, time
 from bson import ObjectId
-from backend import shipments_da
+from backend import shipments_da, streaming
 from backend.auth_utils import get_current_user, require_role
+from backend import principal_cache, mailer, sessions, notifications, role_management, migrations, audit
 
-load_dotenv()
 router = APIRouter()
 
 # ======================================================
 #  DATABASE CONNECTION
 # ======================================================
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_APP")]  # type: ignore
+from backend.db import client, db
 
 requests_col = db["admin_requests"]
 users_col = db["user"]
 sessions_col = db["logged_sessions"]
 replies_col = db["adminreplies"]  
+otp_col = db["otp_store"]
+
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 200
+
+OVERVIEW_CACHE_TTL = float(os.getenv("ADMIN_OVERVIEW_TTL", "5"))
+OVERVIEW_RECENT = 5
+
+# one snapshot shared by every admin; the lock makes concurrent misses compute it once
+_overview: dict = {"expires": 0.0, "value": None}
+_overview_lock = asyncio.Lock()
+
+
+def _expire_overview(event: dict):
+    _overview["expires"] = 0.0
+
+
+# a new or answered request makes the cached counts stale
+notifications.on_event(_expire_overview)
+
+# Fields the admin dashboard shows; password hashes and Google profile data never leave the server
+USER_LIST_FIELDS = {"_id": 0, "username": 1, "email": 1, "role": 1, "firstname": 1,
+                    "lastname": 1, "auth_provider": 1, "created_at": 1}
+REQUEST_LIST_FIELDS = {"username": 1, "email": 1, "type": 1, "title": 1, "description": 1,
+                       "status": 1, "requested_at": 1, "admin_action_at": 1}
+REPLY_LIST_FIELDS = {"request_id": 1, "username": 1, "admin": 1, "reply": 1,
+                     "request_title": 1, "sent_at": 1}
+
+
+def ensure_indexes():
+    # users.username is indexed by user.ensure_indexes
+    users_col.create_index([("role", ASCENDING), ("username", ASCENDING)], name="role_username")
+    requests_col.create_index([("status", ASCENDING), ("requested_at", DESCENDING)], name="status_requested_at")
+    requests_col.create_index([("requested_at", DESCENDING)], name="requested_at")
+    replies_col.create_index([("sent_at", DESCENDING)], name="sent_at")
+    replies_col.create_index([("username", ASCENDING), ("sent_at", DESCENDING)], name="username_sent_at")
+
 
 # ======================================================
-#  SMTP CONFIG
+#  PAGED LISTINGS
 # ======================================================
-MAIL_USERNAME = os.getenv("MAIL_USERNAME")
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-MAIL_FROM = os.getenv("MAIL_FROM")
-MAIL_SERVER = os.getenv("MAIL_SERVER")
-MAIL_PORT = int(os.getenv("MAIL_PORT"))  # type: ignore
+def parse_sort(sort: str, allowed: tuple) -> list:
+    """'-requested_at' → [("requested_at", -1)]; only whitelisted fields."""
+    field = sort.lstrip("-+")
+    if field not in allowed:
+        raise HTTPException(400, f"Cannot sort by '{field}'")
+    return [(field, DESCENDING if sort.startswith("-") else ASCENDING)]
+
+
+def paged(col, query: dict, projection: dict, sort: list, page: int, limit: int) -> dict:
+    page = max(page, 1)
+    limit = min(max(limit, 1), LIST_MAX_LIMIT)
+
+    # a plain find lets the sort use an index; $facet sub-pipelines cannot
+    items = list(col.find(query, projection).sort(sort).skip((page - 1) * limit).limit(limit))
+    for item in items:
+        if "_id" in item:
+            item["_id"] = str(item["_id"])
+
+    total = col.count_documents(query) if query else col.estimated_document_count()
+
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "limit": limit
+    }
+
+
+def list_requests(query: dict, sort: str, page: int, limit: int) -> dict:
+    result = paged(requests_col, query, REQUEST_LIST_FIELDS,
+                   parse_sort(sort, ("requested_at", "admin_action_at", "status")), page, limit)
+    return {"requests": result.pop("items"), **result}
 
 # ======================================================
-#  SMTP SENDER
+#  EMAIL (queued, sent by backend.mailer)
 # ======================================================
 def send_email(to_email: str, subject: str, body: str):
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = MAIL_FROM  # type: ignore
-    msg["To"] = to_email
-
     try:
-        with smtplib.SMTP(MAIL_SERVER, MAIL_PORT) as server:  # type: ignore
-            server.starttls()
-            server.login(MAIL_USERNAME, MAIL_PASSWORD)  # type: ignore
-            server.sendmail(MAIL_FROM, to_email, msg.as_string())  # type: ignore
+        mailer.enqueue(to_email, subject, body)
         return True, None
     except Exception as e:
         return False, str(e)
@@ -67,9 +119,11 @@ def delete_user(username: str, current_user=Depends(get_current_user)):
         raise HTTPException(404, "User not found")
 
     users_col.delete_one({"username": username})
+    sessions.invalidate_principals(username)
 
-    # also delete sessions
-    sessions_col.delete_many({"username": username})
+    # also revoke sessions
+    sessions.revoke({"username": username})
+    audit.record("delete_user", current_user["username"], username)
 
     return {"success": True, "message": f"{username} deleted"}  
 # ======================================================
@@ -87,7 +141,9 @@ def delete_admin(username: str, current_user=Depends(get_current_user)):
         raise HTTPException(400, "User is not admin")
 
     users_col.delete_one({"username": username})
-    sessions_col.delete_many({"username": username})
+    sessions.invalidate_principals(username)
+    sessions.revoke({"username": username})
+    audit.record("delete_admin", current_user["username"], username)
 
     return {"success": True, "message": "Admin deleted"}  
 # ======================================================
@@ -98,28 +154,179 @@ def delete_admin(username: str, current_user=Depends(get_current_user)):
 def force_logout(username: str, current_user=Depends(get_current_user)):
     require_super_admin(current_user)
 
-    result = sessions_col.delete_many({"username": username})
+    revoked = sessions.revoke({"username": username})
+    sessions.invalidate_principals(username)
+    audit.record("force_logout", current_user["username"], username, sessions_removed=revoked)
 
     return {
         "success": True,
         "message": f"{username} logged out",
-        "sessions_removed": result.deleted_count
+        "sessions_removed": revoked
     }
 
+# ======================================================
+#  BULK USER ADMINISTRATION
+# ======================================================
+USER_BULK_FILTER_FIELDS = ["role", "auth_provider", "email_domain"]
+BULK_MAX_USERS = 1000
+
+
+def build_user_bulk_query(data: dict) -> dict:
+    """Selects users by an explicit `usernames` list or a whitelisted `filter`."""
+    usernames = data.get("usernames")
+    flt = data.get("filter")
+
+    if bool(usernames) == bool(flt):
+        raise HTTPException(400, "Provide either usernames or filter")
+
+    if usernames:
+        if not isinstance(usernames, list) or not all(isinstance(u, str) for u in usernames):
+            raise HTTPException(400, "usernames must be a list of strings")
+        if len(usernames) > BULK_MAX_USERS:
+            raise HTTPException(400, f"At most {BULK_MAX_USERS} users per request")
+        return {"username": {"$in": usernames}}
+
+    if not isinstance(flt, dict):
+        raise HTTPException(400, "filter must be an object")
+
+    query = {}
+    for field, value in flt.items():
+        if field not in USER_BULK_FILTER_FIELDS:
+            raise HTTPException(400, f"Cannot filter on '{field}'")
+        if field == "email_domain":
+            if not isinstance(value, str) or not value.strip():
+                raise HTTPException(400, "Invalid value for 'email_domain'")
+            # $type matches the partial filter of email_lower_unique so the planner may use it
+            query["email_lower"] = {"$type": "string",
+                                    "$regex": "@" + re.escape(value.strip().lower().lstrip("@")) + "$"}
+        elif isinstance(value, list) and all(isinstance(v, str) for v in value):
+            query[field] = {"$in": value}
+        elif isinstance(value, str):
+            query[field] = value
+        else:
+            raise HTTPException(400, f"Invalid value for '{field}'")
+    return query
+
+
+def select_bulk_users(data: dict, current_user: dict) -> tuple:
+    """Matching users the caller may act on, plus the usernames that were skipped."""
+    query = build_user_bulk_query(data)
+    found = list(users_col.find(query, {"_id": 0, "username": 1, "email": 1, "role": 1})
+                 .limit(BULK_MAX_USERS + 1))
+    if len(found) > BULK_MAX_USERS:
+        raise HTTPException(400, f"Filter matches more than {BULK_MAX_USERS} users")
+
+    targets, skipped = [], []
+    for u in found:
+        if u["username"] == current_user["username"]:
+            skipped.append({"username": u["username"], "reason": "yourself"})
+        elif u.get("role") == "super_admin" and current_user.get("role") != "super_admin":
+            skipped.append({"username": u["username"], "reason": "super admin"})
+        else:
+            targets.append(u)
+    return targets, skipped
+
+
+def notify_users(targets: list, subject: str, body) -> int:
+    """Queue one email per user with an address; delivery happens in the mailer worker."""
+    messages = [{"to": u["email"], "subject": subject, "body": body(u)} for u in targets if u.get("email")]
+    mailer.enqueue_many(messages)
+    return len(messages)
+
+
+@router.post("/superadmin/users/bulk-delete")
+def bulk_delete_users(data: dict = Body(...), current_user=Depends(get_current_user)):
+    require_super_admin(current_user)
+
+    targets, skipped = select_bulk_users(data, current_user)
+    if not targets:
+        return {"success": True, "deleted": 0, "skipped": skipped}
+
+    names = [u["username"] for u in targets]
+    emails = [u["email"].lower() for u in targets if u.get("email")]
+
+    result = users_col.bulk_write([DeleteMany({"username": {"$in": names}})], ordered=False)
+    sessions.invalidate_principals(*names)
+    revoked = sessions.revoke({"username": {"$in": names}})
+    otps = otp_col.delete_many({"email": {"$in": emails}}).deleted_count if emails else 0
+    replies = replies_col.delete_many({"username": {"$in": names}}).deleted_count
+
+    audit.record("bulk_delete_users", current_user["username"], names, sessions_revoked=revoked)
+
+    queued = notify_users(targets, "Your SCMXpert account was removed",
+                          lambda u: f"Hello {u['username']}, your account has been deleted by an administrator.")
+
+    return {
+        "success": True,
+        "deleted": result.deleted_count,
+        "sessions_revoked": revoked,
+        "otps_removed": otps,
+        "replies_removed": replies,
+        "emails_queued": queued,
+        "skipped": skipped
+    }
+
+
+@router.post("/admin/users/bulk-set-role")
+def bulk_set_role(data: dict = Body(...), current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin", "super_admin"])
+
+    new_role = (data.get("role") or "").lower().strip()
+    if new_role not in role_management.ALLOWED + ["super_admin"]:
+        raise HTTPException(400, "Invalid role")
+    if new_role == "super_admin" and current_user.get("role") != "super_admin":
+        raise HTTPException(403, "Only super admin can assign super_admin role")
+
+    targets, skipped = select_bulk_users(data, current_user)
+    targets = [u for u in targets if u.get("role") != new_role]
+    if not targets:
+        return {"success": True, "modified": 0, "skipped": skipped}
+
+    names = [u["username"] for u in targets]
+    result = users_col.bulk_write(
+        [UpdateMany({"username": {"$in": names}}, {"$set": {"role": new_role}})], ordered=False
+    )
+    sessions.invalidate_principals(*names)
+    audit.record("bulk_set_role", current_user["username"], names, role=new_role)
+
+    queued = notify_users(targets, "SCMXpert Role Updated",
+                          lambda u: f"Hello {u['username']}, your role has been updated "
+                                    f"from {u.get('role', 'user')} to {new_role}.")
+
+    return {
+        "success": True,
+        "modified": result.modified_count,
+        "emails_queued": queued,
+        "skipped": skipped
+    }
+
+
+@router.post("/superadmin/users/bulk-force-logout")
+def bulk_force_logout(data: dict = Body(...), current_user=Depends(get_current_user)):
+    require_super_admin(current_user)
+
+    targets, skipped = select_bulk_users(data, current_user)
+    names = [u["username"] for u in targets]
+    revoked = sessions.revoke({"username": {"$in": names}}) if names else 0
+    sessions.invalidate_principals(*names)
+    audit.record("bulk_force_logout", current_user["username"], names, sessions_removed=revoked)
+
+    return {"success": True, "users": len(names), "sessions_removed": revoked, "skipped": skipped}
+
+
 # ======================================================
 #  UNIVERSAL FIND FUNCTION (string ID + old ObjectId)
 # ======================================================
 def find_request_by_id(request_id: str):
-    """Match both string IDs and old ObjectIds."""
-    if ObjectId.is_valid(request_id):
-        return requests_col.find_one({
-            "$or": [
-                {"_id": request_id},           # string ID
-                {"_id": ObjectId(request_id)}  # old ObjectId
-            ]
-        })
-    else:
+    """Match both string IDs and old ObjectIds until the ID migration has run."""
+    if migrations.is_complete(migrations.REQUEST_STRING_IDS) or not ObjectId.is_valid(request_id):
         return requests_col.find_one({"_id": request_id})
+    return requests_col.find_one({
+        "$or": [
+            {"_id": request_id},           # string ID
+            {"_id": ObjectId(request_id)}  # old ObjectId
+        ]
+    })
 
 
 # ======================================================
@@ -138,6 +345,8 @@ def create_request(data: dict, user=Depends(get_current_user)):
         "status": "pending"
     }
     requests_col.insert_one(payload)
+    notifications.publish_request(payload)
+    audit.record("create_request", user["username"], payload["_id"], type=payload["type"])
     return {"success": True, "message": "Request submitted"}
 
 
@@ -145,36 +354,71 @@ def create_request(data: dict, user=Depends(get_current_user)):
 #  ADMIN — GET ALL REQUESTS
 # ======================================================
 @router.get("/admin/requests")
-def get_all_requests(current_user=Depends(get_current_user)):
+def get_all_requests(
+    status: str = None,  # type: ignore
+    username: str = None,  # type: ignore
+    sort: str = "-requested_at",
+    page: int = 1,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user=Depends(get_current_user)
+):
     require_role(current_user, ["admin","super_admin"])
-    reqs = []
-    for r in requests_col.find({}):
-        r["_id"] = str(r["_id"])
-        reqs.append(r)
-    return {"requests": reqs}
+    query = {}
+    if status:
+        query["status"] = status
+    if username:
+        query["username"] = username
+    return list_requests(query, sort, page, limit)
 
 
 # ======================================================
 #  ADMIN — GET ONLY PENDING REQUESTS
 # ======================================================
 @router.get("/admin/pending")
-def get_pending(current_user=Depends(get_current_user)):
+def get_pending(
+    username: str = None,  # type: ignore
+    sort: str = "-requested_at",
+    page: int = 1,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user=Depends(get_current_user)
+):
     require_role(current_user, ["admin","super_admin"])
-    data = []
-    for r in requests_col.find({"status": "pending"}):
-        r["_id"] = str(r["_id"])
-        data.append(r)
-    return {"requests": data}
+    query = {"status": "pending"}
+    if username:
+        query["username"] = username
+    return list_requests(query, sort, page, limit)
 
 
 # ======================================================
 #  ADMIN — GET ALL USERS
 # ======================================================
 @router.get("/admin/users")
-def get_users(current_user=Depends(get_current_user)):
+def get_users(
+    q: str = None,  # type: ignore
+    role: str = None,  # type: ignore
+    sort: str = "username",
+    page: int = 1,
+    limit: int = LIST_DEFAULT_LIMIT,
+    format: str = None,  # type: ignore
+    current_user=Depends(get_current_user)
+):
     require_role(current_user, ["admin","super_admin"])
-    users = list(users_col.find({}, {"_id": 0}))
-    return {"users": users}
+    query = {}
+    if role:
+        query["role"] = role
+    if q and q.strip():
+        # anchored prefix → index range scan on username / email_lower; the email_lower
+        # index is partial ($type: string), so the predicate has to say so to use it
+        prefix = {"$regex": "^" + re.escape(q.strip())}
+        query["$or"] = [{"username": prefix},
+                        {"email_lower": {"$type": "string", "$regex": "^" + re.escape(q.strip().lower())}}]
+
+    order = parse_sort(sort, ("username", "role", "created_at"))
+    # streamed: every matching user at constant memory, so no page/limit/total
+    if streaming.check_format(format):
+        return streaming.respond(format, "users", users_col.find(query, USER_LIST_FIELDS).sort(order))
+    result = paged(users_col, query, USER_LIST_FIELDS, order, page, limit)
+    return {"users": result.pop("items"), **result}
 
 
 # ======================================================
@@ -184,18 +428,21 @@ def get_users(current_user=Depends(get_current_user)):
 def approve_request(request_id: str, current_user=Depends(get_current_user)):
     require_role(current_user, ["admin","super_admin"])
 
-    req = requests_col.find_one({"_id": request_id})
+    req = find_request_by_id(request_id)
     if not req:
         raise HTTPException(404, "Request not found")
 
     requests_col.update_one(
-        {"_id": request_id},
+        {"_id": req["_id"]},
         {"$set": {"status": "approved", "admin_action_at": datetime.utcnow()}}
     )
+    notifications.publish_request({**req, "status": "approved"}, "update")
+    audit.record("approve_request", current_user["username"], str(req["_id"]), username=req["username"])
     users_col.update_one(
         {"username": req["username"]},
         {"$set": {"role": "admin"}}
     )
+    sessions.invalidate_principals(req["username"])
 
     if req.get("email"):
         send_email(req["email"],
@@ -212,14 +459,16 @@ def approve_request(request_id: str, current_user=Depends(get_current_user)):
 def reject_request(request_id: str, current_user=Depends(get_current_user)):
     require_role(current_user, ["admin","super_admin"])
 
-    req = requests_col.find_one({"_id": request_id})
+    req = find_request_by_id(request_id)
     if not req:
         raise HTTPException(404, "Request not found")
 
     requests_col.update_one(
-        {"_id": request_id},
+        {"_id": req["_id"]},
         {"$set": {"status": "rejected", "admin_action_at": datetime.utcnow()}}
     )
+    notifications.publish_request({**req, "status": "rejected"}, "update")
+    audit.record("reject_request", current_user["username"], str(req["_id"]), username=req["username"])
 
     if req.get("email"):
         send_email(req["email"],
@@ -237,7 +486,7 @@ def reply_to_request(request_id: str, payload: dict,
                      current_user=Depends(get_current_user)):
     require_role(current_user, ["admin","super_admin"])
 
-    req = requests_col.find_one({"_id": request_id})
+    req = find_request_by_id(request_id)
     if not req:
         raise HTTPException(404, "Request not found")
 
@@ -256,10 +505,15 @@ def reply_to_request(request_id: str, payload: dict,
 
     replies_col.insert_one(reply_doc)   
 
+    # last_reply_at tells the change-stream watcher this update is covered by the reply event
     requests_col.update_one(
-        {"_id": request_id},
-        {"$set": {"status": "resolved", "admin_action_at": datetime.utcnow()}}
+        {"_id": req["_id"]},
+        {"$set": {"status": "resolved", "admin_action_at": datetime.utcnow(),
+                  "last_reply_at": reply_doc["sent_at"]}}
     )
+    # one event per reply: it also tells dashboards the request is resolved
+    notifications.publish_reply(reply_doc)
+    audit.record("reply_request", current_user["username"], str(req["_id"]), username=req["username"])
 
     return {"success": True, "message": "Reply sent & request resolved"}
 
@@ -268,13 +522,24 @@ def reply_to_request(request_id: str, payload: dict,
 #  ADMIN — GET ALL REPLIES
 # ======================================================
 @router.get("/admin/replies")
-def get_replies(current_user=Depends(get_current_user)):
+def get_replies(
+    username: str = None,  # type: ignore
+    admin: str = None,  # type: ignore
+    sort: str = "-sent_at",
+    page: int = 1,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user=Depends(get_current_user)
+):
     require_role(current_user, ["admin","super_admin"])
-    data = []
-    for r in replies_col.find().sort("sent_at", -1):
-        r["_id"] = str(r["_id"])
-        data.append(r)
-    return {"replies": data}
+    query = {}
+    if username:
+        query["username"] = username
+    if admin:
+        query["admin"] = admin
+
+    result = paged(replies_col, query, REPLY_LIST_FIELDS,
+                   parse_sort(sort, ("sent_at",)), page, limit)
+    return {"replies": result.pop("items"), **result}
 
 
 # ======================================================
@@ -322,6 +587,8 @@ def set_role(username: str, payload: dict, current_user=Depends(get_current_user
         {"username": username},
         {"$set": {"role": new_role}}
     )
+    sessions.invalidate_principals(username)
+    audit.record("set_role", current_user["username"], username, old_role=current_role, role=new_role)
 
     if user.get("email"):
         send_email(
@@ -343,15 +610,146 @@ def set_role(username: str, payload: dict, current_user=Depends(get_current_user
 def get_logged_sessions(current_user=Depends(get_current_user)):
     require_role(current_user, ["admin","super_admin"])
 
-    sessions = list(
-        sessions_col.find({}, {"_id": 1, "username": 1, "ts": 1, "logged_at": 1})
+    active = list(
+        sessions_col.find({"revoked_at": {"$exists": False}}, {"_id": 1, "username": 1, "ts": 1, "logged_at": 1})
         .sort("logged_at", -1)
         .limit(100)
     )
-    for s in sessions:
+    for s in active:
         s["_id"] = str(s["_id"])
 
-    return {"sessions": sessions}
+    return {"sessions": active}
+
+
+# ======================================================
+#  ADMIN — OVERVIEW (dashboard counts + recent items)
+# ======================================================
+def _counts(rows: list) -> dict:
+    return {str(row["_id"]): row["count"] for row in rows if row["_id"] is not None}
+
+
+def _group_count(field: str) -> list:
+    return [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+
+
+def _recent(field: str, projection: dict) -> list:
+    return [{"$sort": {field: -1}}, {"$limit": OVERVIEW_RECENT}, {"$project": projection}]
+
+
+def _facet(col, facets: dict) -> dict:
+    result = next(col.aggregate([{"$facet": facets}]))
+    for rows in result.values():
+        for row in rows:
+            if "_id" in row and not isinstance(row["_id"], (str, type(None))):
+                row["_id"] = str(row["_id"])
+    return result
+
+
+def _overview_users() -> dict:
+    r = _facet(users_col, {"total": [{"$count": "n"}], "by_role": _group_count("role")})
+    return {"total": r["total"][0]["n"] if r["total"] else 0, "by_role": _counts(r["by_role"])}
+
+
+def _overview_requests() -> dict:
+    r = _facet(requests_col, {
+        "by_status": _group_count("status"),
+        "recent_pending": [{"$match": {"status": "pending"}}] + _recent("requested_at", REQUEST_LIST_FIELDS)
+    })
+    by_status = _counts(r["by_status"])
+    return {"total": sum(by_status.values()), "pending": by_status.get("pending", 0),
+            "by_status": by_status, "recent_pending": r["recent_pending"]}
+
+
+def _overview_replies() -> dict:
+    r = _facet(replies_col, {"total": [{"$count": "n"}], "recent": _recent("sent_at", REPLY_LIST_FIELDS)})
+    return {"total": r["total"][0]["n"] if r["total"] else 0, "recent": r["recent"]}
+
+
+def _overview_sessions() -> dict:
+    r = _facet(sessions_col, {
+        "active": [{"$match": {"revoked_at": {"$exists": False}}}, {"$count": "n"}],
+        "recent": [{"$match": {"revoked_at": {"$exists": False}}}]
+                  + _recent("logged_at", {"_id": 0, "username": 1, "ts": 1, "logged_at": 1})
+    })
+    return {"active": r["active"][0]["n"] if r["active"] else 0, "recent": r["recent"]}
+
+
+def _overview_shipments() -> dict:
+    stats = shipments_da.compute_shipment_stats({})
+    return {"total": stats["total"], "by_status": stats["status"]}
+
+
+async def compute_overview() -> dict:
+    users, reqs, replies, logged_in, shipments = await asyncio.gather(
+        asyncio.to_thread(_overview_users),
+        asyncio.to_thread(_overview_requests),
+        asyncio.to_thread(_overview_replies),
+        asyncio.to_thread(_overview_sessions),
+        asyncio.to_thread(_overview_shipments),
+    )
+    return {
+        "users": users,
+        "requests": reqs,
+        "replies": replies,
+        "sessions": logged_in,
+        "shipments": shipments,
+        "generated_at": datetime.utcnow()
+    }
+
+
+@router.get("/admin/overview")
+async def get_overview(current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin","super_admin"])
+
+    if _overview["value"] is not None and time.monotonic() < _overview["expires"]:
+        return _overview["value"]
+
+    async with _overview_lock:
+        if _overview["value"] is None or time.monotonic() >= _overview["expires"]:
+            _overview["value"] = await compute_overview()
+            _overview["expires"] = time.monotonic() + OVERVIEW_CACHE_TTL
+    return _overview["value"]
+
+
+# ======================================================
+#  ADMIN — PRINCIPAL CACHE METRICS
+# ======================================================
+@router.get("/admin/metrics/principal-cache")
+def get_principal_cache_stats(current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin","super_admin"])
+    return principal_cache.stats()
+
+
+# ======================================================
+#  ADMIN — AUDIT LOG
+# ======================================================
+AUDIT_LIST_FIELDS = {"_id": 0, "ts": 1, "action": 1, "actor": 1, "target": 1,
+                     "outcome": 1, "ip": 1, "details": 1}
+
+
+@router.get("/admin/audit")
+def get_audit_log(
+    actor: str = None,  # type: ignore
+    action: str = None,  # type: ignore
+    page: int = 1,
+    limit: int = LIST_DEFAULT_LIMIT,
+    current_user=Depends(get_current_user)
+):
+    require_role(current_user, ["admin","super_admin"])
+    query = {}
+    if actor:
+        query["actor"] = actor
+    if action:
+        query["action"] = action
+
+    result = paged(audit.audit_col, query, AUDIT_LIST_FIELDS, [("ts", DESCENDING)], page, limit)
+    return {"events": result.pop("items"), **result}
+
+
+@router.get("/admin/metrics/audit")
+def get_audit_stats(current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin","super_admin"])
+    return audit.stats()
 
 
 # ======================================================
@@ -361,14 +759,16 @@ def get_logged_sessions(current_user=Depends(get_current_user)):
 def resolve_request(request_id: str, current_user=Depends(get_current_user)):
     require_role(current_user, ["admin","super_admin"])
 
-    req = requests_col.find_one({"_id": request_id})
+    req = find_request_by_id(request_id)
     if not req:
         raise HTTPException(404, "Request not found")
 
     requests_col.update_one(
-        {"_id": request_id},
+        {"_id": req["_id"]},
         {"$set": {"status": "resolved", "admin_action_at": datetime.utcnow()}}
     )
+    notifications.publish_request({**req, "status": "resolved"}, "update")
+    audit.record("resolve_request", current_user["username"], str(req["_id"]), username=req["username"])
 
     return {"success": True}
  
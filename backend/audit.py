@@ -0,0 +1,159 @@
+# =======================================
+# audit.py
+# Structured audit trail for admin and auth actions. Handlers append to
+# an in-memory buffer; a background worker writes it to `audit_log` with
+# insert_many once it fills up or every few seconds.
+# =======================================
+
+from collections import deque
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+import asyncio
+import logging
+import os
+import threading
+
+from backend.rate_limit import client_ip
+
+logger = logging.getLogger("audit")
+
+FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2"))
+# past this many unwritten events new ones are dropped (and counted) rather than growing memory
+MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "10000"))
+RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "0"))  # 0 keeps history forever
+
+from backend.db import client, db
+audit_col = db["audit_log"]
+
+_buffer: deque = deque()
+_lock = threading.Lock()
+_stats = {"recorded": 0, "written": 0, "dropped": 0, "failed_flushes": 0}
+_loop: asyncio.AbstractEventLoop = None  # type: ignore
+_wake: asyncio.Event = None  # type: ignore
+_worker: asyncio.Task = None  # type: ignore
+
+
+def ensure_indexes():
+    audit_col.create_index([("ts", DESCENDING)], name="ts")
+    audit_col.create_index([("actor", ASCENDING), ("ts", DESCENDING)], name="actor_ts")
+    audit_col.create_index([("action", ASCENDING), ("ts", DESCENDING)], name="action_ts")
+    if RETENTION_DAYS > 0:
+        audit_col.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+
+
+# ======================================================
+#  RECORD (called from request handlers, any thread)
+# ======================================================
+def record(action: str, actor: str = None, target=None, request=None, outcome: str = "ok", **details):  # type: ignore
+    now = datetime.utcnow()
+    event = {
+        "ts": now,
+        "action": action,
+        "actor": actor,
+        "target": target,
+        "outcome": outcome,
+        "ip": client_ip(request) if request is not None else None,
+    }
+    if details:
+        event["details"] = details
+    if RETENTION_DAYS > 0:
+        event["expires_at"] = now + timedelta(days=RETENTION_DAYS)
+
+    with _lock:
+        if len(_buffer) >= MAX_BUFFER:
+            _stats["dropped"] += 1
+            return
+        _buffer.append(event)
+        _stats["recorded"] += 1
+        full = len(_buffer) >= FLUSH_SIZE
+
+    if full and _wake is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+# ======================================================
+#  FLUSH
+# ======================================================
+def flush() -> int:
+    """Write everything buffered so far. Returns the number of events written."""
+    with _lock:
+        if not _buffer:
+            return 0
+        batch = list(_buffer)
+        _buffer.clear()
+
+    # insert_many stamps an _id on every event, and a re-queued event keeps it:
+    # a retry after a partial write reports the stored ones as duplicates
+    try:
+        audit_col.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        # unordered: every event without a write error was stored. A duplicate key
+        # means an earlier attempt stored it; anything else will not succeed on retry.
+        errors = e.details.get("writeErrors", [])
+        rejected = sum(1 for err in errors if err.get("code") != 11000)
+        with _lock:
+            _stats["failed_flushes"] += 1
+            _stats["dropped"] += rejected
+            _stats["written"] += len(batch) - rejected
+        if rejected:
+            logger.warning("Audit flush rejected %d of %d events: %s",
+                           rejected, len(batch), errors[0].get("errmsg"))
+        return len(batch) - rejected
+    except Exception as e:
+        # nothing is known to be stored (network error, timeout): retry the batch
+        with _lock:
+            _stats["failed_flushes"] += 1
+            # put them back in front, keeping the buffer bounded
+            room = MAX_BUFFER - len(_buffer)
+            keep = batch[-room:] if room > 0 else []
+            _stats["dropped"] += len(batch) - len(keep)
+            _buffer.extendleft(reversed(keep))
+        logger.warning("Audit flush of %d events failed: %s", len(batch), e)
+        return 0
+
+    with _lock:
+        _stats["written"] += len(batch)
+    return len(batch)
+
+
+async def run_worker():
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            await asyncio.to_thread(flush)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Audit worker error: %s", e)
+
+
+def start():
+    global _loop, _wake, _worker
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    if _worker is None or _worker.done():
+        _worker = _loop.create_task(run_worker())
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None  # type: ignore
+    # whatever is still buffered goes out before the process exits
+    await asyncio.to_thread(flush)
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "buffered": len(_buffer), "max_buffer": MAX_BUFFER}
@@ -3,16 +3,9 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from datetime import datetime
 import os
-from dotenv import load_dotenv
-from pymongo import MongoClient
 import asyncio
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from backend import principal_cache, mailer, sessions
 
-load_dotenv()
 
 # ================= JWT CONFIG ================= #
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -20,8 +13,7 @@ ALGORITHM = os.getenv("ALGORITHM")
 oauth2 = OAuth2PasswordBearer(tokenUrl="login")
 
 # ================= MONGO ================= #
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_APP")] # type: ignore
+from backend.db import client, db
 users = db["user"]
 
 # ================= AUTH HELPERS ================= #
@@ -34,7 +26,10 @@ def get_current_user(token: str = Depends(oauth2)):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    user = users.find_one({"username": username})
+    if sessions.is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=401, detail="Session revoked")
+
+    user = principal_cache.resolve(username, lambda u: users.find_one({"username": u}))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
@@ -50,43 +45,10 @@ def require_role(user, allowed_roles: list):
         )
 
 
-# ================= EMAIL CONFIG ================= #
-# Gmail SMTP (Correct)
-MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
-MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
-MAIL_USERNAME = os.getenv("MAIL_USERNAME")
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-MAIL_FROM = os.getenv("MAIL_FROM") or MAIL_USERNAME
-MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "True").lower() in ("1", "true", "yes")
-
-
-def _sync_send_email(subject: str, recipients: list, body: str):
-    if not MAIL_USERNAME or not MAIL_PASSWORD or not MAIL_FROM:
-        raise RuntimeError("SMTP credentials not configured (MAIL_USERNAME/MAIL_PASSWORD/MAIL_FROM)")
-
-    msg = MIMEMultipart()
-    msg["From"] = MAIL_FROM
-    msg["To"] = ", ".join(recipients)
-    msg["Subject"] = Header(subject, 'utf-8') # type: ignore
-    msg.attach(MIMEText(body, "html", "utf-8"))
-
-    # connect and send
-    server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=10)
-    try:
-        if MAIL_USE_TLS:
-            server.starttls()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD)
-        server.sendmail(MAIL_FROM, recipients, msg.as_string())
-    finally:
-        try:
-            server.quit()
-        except Exception:
-            pass
-
-
+# ================= EMAIL ================= #
 async def send_email(subject: str, recipients: list, body: str):
     """
-    Send an HTML email using configured SMTP. This runs the blocking SMTP call in a thread.
-    Raises RuntimeError on missing config or smtplib.SMTPException on send errors.
+    Queue an HTML email for the background mailer (see backend.mailer).
+    Returns once the message is stored; delivery and retries happen off-request.
     """
-    return await asyncio.to_thread(_sync_send_email, subject, recipients, body)
+    return await asyncio.to_thread(mailer.enqueue, recipients, subject, body, "html")
@@ -1,27 +1,34 @@
+# =======================================
+# db.py
+# The process-wide MongoClient. Every module takes its database handles
+# from here instead of opening its own client and pool. The client is
+# created with connect=False, so importing a module never touches the
+# network: the pool is opened by the first query, in whichever worker
+# process runs it. connect_db() pings during startup so a bad URI fails
+# fast rather than on the first request.
+#
+# metrics.py and profiling.py register pymongo listeners, which only
+# attach to clients created after them; main.py imports them first.
+# =======================================
+
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
-from datetime import datetime, date, timezone
-import os 
-from dotenv import load_dotenv  
+import asyncio
+import os
 
- # from motor.motor_asyncio import AsyncIOMotorClient
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB_APP")
- 
-client:MongoClient = None # type: ignore
-db = None
+IOT_DB_NAME = os.getenv("MONGO_DB_IOT")
+
+client: MongoClient = MongoClient(MONGO_URI, connect=False, serverSelectionTimeoutMS=5000)
+db = client[DB_NAME]  # type: ignore
+iot_db = client[IOT_DB_NAME]  # type: ignore
+
 
 async def connect_db():
-    global client, db
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        
-        # 👇 This actually tests the connection
-        client.admin.command("ping")
-        
-        db = client[DB_NAME]  # type: ignore
+        await asyncio.to_thread(client.admin.command, "ping")
         print("  MongoDB Connection Confirmed!")
-        
     except ServerSelectionTimeoutError:
         print("  Connection FAILED: Could not reach MongoDB server (timeout).")
         raise
@@ -31,13 +38,9 @@ async def connect_db():
 
 
 async def close_db():
-    global client
-    if client:
-        client.close()
-        print(" MongoDB connection closed.")
+    client.close()
+    print(" MongoDB connection closed.")
 
 
 def get_db():
-    if db is None:
-        raise RuntimeError("Database not initialized. Call connect_db() first.")
-    return db
\ No newline at end of file
+    return db
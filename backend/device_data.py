@@ -1,23 +1,16 @@
 from fastapi import APIRouter, Form, Depends, HTTPException
-from pymongo import MongoClient
 from datetime import datetime, timezone
 from backend.auth_utils import get_current_user
 from bson import ObjectId
+from backend.db import client, iot_db as db
+from backend import streaming
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 router = APIRouter()
 
 # ============================================================
 #  DATABASE CONNECTION
 # ============================================================
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB = os.getenv("MONGO_DB_IOT")
-
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB] # type: ignore
-
 # Main IoT collection
 device_data_collection = db["sensor_readings"]
 
@@ -41,6 +34,17 @@ def resolve_timestamp(record: dict):
     return ""
 
 
+def format_reading(r: dict) -> dict:
+    return {
+        "Device_ID": r.get("Device_ID", ""),
+        "Battery_Level": r.get("Battery_Level", ""),
+        "First_Sensor_temperature": r.get("First_Sensor_temperature", ""),
+        "Route_From": r.get("Route_From", ""),
+        "Route_To": r.get("Route_To", ""),
+        "timestamp": resolve_timestamp(r),
+    }
+
+
 # ============================================================
 # 1️ FETCH UNIQUE DEVICE LIST
 # ============================================================
@@ -104,25 +108,14 @@ def get_recent_data():
 
         print("DEBUG RECORD COUNT:", len(records))
 
-        final_records = []
-        for r in records:
-            final_records.append({
-                "Device_ID": r.get("Device_ID", ""),
-                "Battery_Level": r.get("Battery_Level", ""),
-                "First_Sensor_temperature": r.get("First_Sensor_temperature", ""),
-                "Route_From": r.get("Route_From", ""),
-                "Route_To": r.get("Route_To", ""),
-                "timestamp": resolve_timestamp(r)
-            })
-
-        return {"records": final_records}
+        return {"records": [format_reading(r) for r in records]}
 
     except Exception as e:
         print(" ERROR in /device-data/recent:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/device-data/{device_id}")
-def get_device_by_id(device_id: str):
+def get_device_by_id(device_id: str, format: str = None):  # type: ignore
 
     # Convert to int if possible (Mongo stores numbers, not strings)
     try:
@@ -130,23 +123,14 @@ def get_device_by_id(device_id: str):
     except ValueError:
         pass
 
-    records = list(
+    records = (
         device_data_collection
         .find({"Device_ID": device_id})
         .sort("timestamp", -1)
     )
 
-    final = []
-    for r in records:
-        final.append({
-            "Device_ID": r.get("Device_ID", ""),
-            "Battery_Level": r.get("Battery_Level", ""),
-            "First_Sensor_temperature": r.get("First_Sensor_temperature", ""),
-            "Route_From": r.get("Route_From", ""),
-            "Route_To": r.get("Route_To", ""),
-            "timestamp": resolve_timestamp(r),
-        })
-
-    return {"records": final}
+    if streaming.check_format(format):
+        return streaming.respond(format, "records", (format_reading(r) for r in records))
+    return {"records": [format_reading(r) for r in records]}
 
 
@@ -0,0 +1,259 @@
+# =======================================
+# mailer.py
+# Outbound email: handlers enqueue into the `mail_queue` collection and
+# return; a background worker drains it over one reused SMTP connection,
+# retrying failures with exponential backoff.
+# =======================================
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.header import Header
+from email.mime.text import MIMEText
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+import os
+import smtplib
+import time
+
+from backend import metrics
+
+logger = logging.getLogger("mailer")
+
+# ======================================================
+#  SMTP CONFIG
+# ======================================================
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
+MAIL_FROM = os.getenv("MAIL_FROM") or os.getenv("MAIL_USERNAME")
+MAIL_USERNAME = os.getenv("MAIL_USERNAME") or MAIL_FROM
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "True").lower() in ("1", "true", "yes")
+
+# ======================================================
+#  QUEUE CONFIG
+# ======================================================
+BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", "1"))
+MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+BACKOFF_SECONDS = float(os.getenv("MAIL_BACKOFF_SECONDS", "30"))
+LEASE_SECONDS = int(os.getenv("MAIL_LEASE_SECONDS", "120"))
+SMTP_IDLE_SECONDS = float(os.getenv("MAIL_SMTP_IDLE_SECONDS", "60"))
+# finished (sent or failed) messages are kept this long, without their body
+RETENTION_SECONDS = int(os.getenv("MAIL_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+from backend.db import client, db
+mail_queue = db["mail_queue"]
+
+# SMTP connections are not thread-safe; all sending happens on this one thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mailer")
+_worker: asyncio.Task = None  # type: ignore
+_smtp: smtplib.SMTP = None  # type: ignore
+_smtp_last_used = 0.0
+
+
+def ensure_indexes():
+    mail_queue.create_index([("status", 1), ("next_attempt_at", 1)], name="status_next_attempt")
+    # finished mail is kept for troubleshooting, then dropped by Mongo; replaces
+    # the earlier sent_at TTL, which never expired failed messages
+    try:
+        mail_queue.drop_index("sent_at_ttl")
+    except OperationFailure:
+        pass
+    mail_queue.create_index("finished_at", expireAfterSeconds=RETENTION_SECONDS, name="finished_at_ttl")
+
+    # messages finished before finished_at existed: expire from now, bodies (OTPs, exports) dropped
+    mail_queue.update_many(
+        {"status": {"$in": ["sent", "failed"]}, "finished_at": {"$exists": False}},
+        {"$set": {"finished_at": datetime.utcnow()}, "$unset": {"body": ""}}
+    )
+
+
+# ======================================================
+#  ENQUEUE (called from request handlers)
+# ======================================================
+def enqueue(to, subject: str, body: str, subtype: str = "plain"):
+    recipients = [to] if isinstance(to, str) else list(to)
+    now = datetime.utcnow()
+    mail_queue.insert_one({
+        "to": recipients,
+        "subject": subject,
+        "body": body,
+        "subtype": subtype,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    })
+
+
+def enqueue_many(messages: list):
+    """messages: dicts with to, subject, body and optional subtype."""
+    if not messages:
+        return
+    now = datetime.utcnow()
+    mail_queue.insert_many([{
+        "to": [m["to"]] if isinstance(m["to"], str) else list(m["to"]),
+        "subject": m["subject"],
+        "body": m["body"],
+        "subtype": m.get("subtype", "plain"),
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    } for m in messages], ordered=False)
+
+
+# ======================================================
+#  SMTP CONNECTION
+# ======================================================
+def _connection() -> smtplib.SMTP:
+    global _smtp, _smtp_last_used
+    if _smtp is not None:
+        try:
+            _smtp.noop()
+        except smtplib.SMTPException:
+            _close_connection()
+
+    if _smtp is None:
+        server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT, timeout=10)
+        if MAIL_USE_TLS:
+            server.starttls()
+        if MAIL_USERNAME and MAIL_PASSWORD:
+            server.login(MAIL_USERNAME, MAIL_PASSWORD)
+        _smtp = server
+
+    _smtp_last_used = time.monotonic()
+    return _smtp
+
+
+def _close_connection():
+    global _smtp
+    if _smtp is not None:
+        try:
+            _smtp.quit()
+        except Exception:
+            pass
+    _smtp = None  # type: ignore
+
+
+def _close_if_idle():
+    if _smtp is not None and time.monotonic() - _smtp_last_used > SMTP_IDLE_SECONDS:
+        _close_connection()
+
+
+def _build_message(doc: dict) -> str:
+    msg = MIMEText(doc["body"], doc.get("subtype", "plain"), "utf-8")
+    msg["Subject"] = Header(doc["subject"], "utf-8")  # type: ignore
+    msg["From"] = MAIL_FROM  # type: ignore
+    msg["To"] = ", ".join(doc["to"])
+    return msg.as_string()
+
+
+# ======================================================
+#  WORKER
+# ======================================================
+def _claim_batch() -> list:
+    now = datetime.utcnow()
+    batch = []
+    for _ in range(BATCH_SIZE):
+        doc = mail_queue.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # a worker died mid-send: its lease has run out
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": "sending", "lease_until": now + timedelta(seconds=LEASE_SECONDS)},
+             "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            break
+        batch.append(doc)
+    return batch
+
+
+def _send_batch(batch: list) -> int:
+    updates = []
+    sent = 0
+
+    for doc in batch:
+        start = time.perf_counter()
+        try:
+            _connection().sendmail(MAIL_FROM, doc["to"], _build_message(doc))  # type: ignore
+            metrics.SMTP_LATENCY.labels("ok").observe(time.perf_counter() - start)
+            metrics.MAIL_MESSAGES.labels("sent").inc()
+            sent_at = datetime.utcnow()
+            updates.append(UpdateOne({"_id": doc["_id"]}, {
+                "$set": {"status": "sent", "sent_at": sent_at, "finished_at": sent_at},
+                # bodies carry OTP codes and data exports; nothing needs them once delivered
+                "$unset": {"lease_until": "", "error": "", "body": ""},
+            }))
+            sent += 1
+        except Exception as e:
+            metrics.SMTP_LATENCY.labels("error").observe(time.perf_counter() - start)
+            if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                _close_connection()
+
+            attempts = doc.get("attempts", 1)
+            if attempts >= MAX_ATTEMPTS:
+                logger.error("Giving up on mail %s to %s: %s", doc["_id"], doc["to"], e)
+                fields = {"status": "failed", "error": str(e), "finished_at": datetime.utcnow()}
+                unset = {"lease_until": "", "body": ""}
+                metrics.MAIL_MESSAGES.labels("failed").inc()
+            else:
+                delay = BACKOFF_SECONDS * (2 ** (attempts - 1))
+                metrics.MAIL_MESSAGES.labels("retried").inc()
+                fields = {"status": "pending", "error": str(e),
+                          "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)}
+                unset = {"lease_until": ""}
+            updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields, "$unset": unset}))
+
+    if updates:
+        mail_queue.bulk_write(updates, ordered=False)
+    return sent
+
+
+def drain_once() -> int:
+    """Claim and send one batch. Returns the number of messages claimed."""
+    batch = _claim_batch()
+    if batch:
+        _send_batch(batch)
+    else:
+        _close_if_idle()
+    return len(batch)
+
+
+async def run_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            claimed = await loop.run_in_executor(_executor, drain_once)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Mail worker error: %s", e)
+            claimed = 0
+        # keep going straight away while there is a backlog
+        if claimed < BATCH_SIZE:
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+def start():
+    global _worker
+    if _worker is None or _worker.done():
+        _worker = asyncio.get_running_loop().create_task(run_worker())
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None  # type: ignore
+    await asyncio.get_running_loop().run_in_executor(_executor, _close_connection)
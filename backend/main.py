@@ -1,16 +1,23 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, FileResponse
-from dotenv import load_dotenv
 from pathlib import Path
+import anyio
+import asyncio
 import os
 import logging
 import sys
-import uvicorn
 
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
+# first: registers the Mongo command listener before any MongoClient exists
+import backend.metrics as metrics
+import backend.profiling as profiling
 from backend import db
 from backend import user
 from backend import shipments_da
@@ -21,12 +28,97 @@ import backend.auth_utils as auth_utils
 import backend.db as db
 import backend.models as models
 import backend.forgetpassword as forgetpassword
+import backend.password_pool as password_pool
+import backend.outbound as outbound
+import backend.mailer as mailer
+import backend.sessions as sessions
+import backend.rate_limit as rate_limit
+import backend.notifications as notifications
+import backend.audit as audit
+import backend.streaming as streaming
 
+IMPORTS_DONE = time.perf_counter()
 
-load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI(title="SCMXpertLite Backend", version="1.0.0")
+# background (default): serve immediately and build indexes alongside;
+# blocking: finish them before accepting traffic; skip: leave them to a deploy step
+STARTUP_INDEXES = os.getenv("STARTUP_INDEXES", "background")
+
+# Sync handlers and dependencies share anyio's threadpool (40 by default) per worker
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "0"))
+
+
+# -------------------- LIFESPAN ------------------------
+def create_indexes():
+    start = time.perf_counter()
+    for module in (shipments_da, user, admin_privileges, mailer, sessions, rate_limit, audit):
+        try:
+            module.ensure_indexes()
+        except Exception as e:
+            logging.warning("Index setup failed for %s: %s", module.__name__, e)
+    elapsed = time.perf_counter() - start
+    metrics.STARTUP_SECONDS.labels("indexes").set(elapsed)
+    logging.info("Indexes ready in %.0f ms", elapsed * 1000)
+
+
+def start_workers():
+    mailer.start()
+    sessions.start()
+    notifications.start()
+    audit.start()
+
+
+async def stop_workers():
+    await notifications.stop()
+    await audit.stop()
+    await mailer.stop()
+    await sessions.stop()
+    password_pool.shutdown()
+    await outbound.aclose()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    phases = {"imports": IMPORTS_DONE - IMPORT_STARTED}
+    if THREADPOOL_SIZE:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    mark = time.perf_counter()
+    try:
+        await db.connect_db()
+    except Exception as e:
+        logging.warning("MongoDB ping failed at startup: %s", e)
+    phases["mongo"] = time.perf_counter() - mark
+
+    # create_indexes reports its own duration, which is only part of startup when blocking
+    if STARTUP_INDEXES == "blocking":
+        mark = time.perf_counter()
+        await asyncio.to_thread(create_indexes)
+        phases["indexes"] = time.perf_counter() - mark
+    elif STARTUP_INDEXES != "skip":
+        app.state.index_task = asyncio.create_task(asyncio.to_thread(create_indexes))
+
+    mark = time.perf_counter()
+    start_workers()
+    phases["workers"] = time.perf_counter() - mark
+    if profiling.ENABLED:
+        profiling.install()
+
+    for phase, seconds in phases.items():
+        if phase != "indexes":
+            metrics.STARTUP_SECONDS.labels(phase).set(seconds)
+    logging.info("Startup in %.0f ms (%s)", sum(phases.values()) * 1000,
+                 ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items()))
+
+    yield
+
+    profiling.uninstall()
+    await stop_workers()
+    await db.close_db()
+
+
+app = FastAPI(title="SCMXpertLite Backend", version="1.0.0", lifespan=lifespan)
 
 #  CORS MUST come first — before routers and static mounts
 origins = [
@@ -44,13 +136,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(streaming.CompressionMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # -------------------- ROUTERS ------------------------
+app.include_router(metrics.router)
 app.include_router(forgetpassword.router)
 app.include_router(user.router)
 app.include_router(shipments_da.router)
 app.include_router(device_data.router)
 app.include_router(admin_privileges.router)
 app.include_router(role_management.router)
+app.include_router(notifications.router)
 
 # -------------------- FRONTEND PATH ------------------------
 FRONTEND_DIR = Path(__file__).resolve().parent.parent / "frontend"
@@ -93,7 +191,10 @@ async def logout_page():
     return RedirectResponse("/frontend/logout.html", status_code=302)
 
 
+# Development server; production runs `python -m backend.serve`
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "backend.main:app",
         host="127.0.0.1",
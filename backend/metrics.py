@@ -0,0 +1,149 @@
+# =======================================
+# metrics.py
+# Prometheus metrics: per-route latency and in-flight requests (ASGI
+# middleware), MongoDB command timings (pymongo CommandListener),
+# threadpool saturation, and timings for outbound SMTP/HTTP calls.
+# Served at GET /metrics.
+#
+# Import this before any module that creates a MongoClient: pymongo only
+# attaches listeners registered before a client is constructed.
+# =======================================
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+from pymongo import monitoring
+import os
+import threading
+import time
+
+import anyio
+
+router = APIRouter()
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # when set, scrapers must send it as a bearer token
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")  # set when running several workers
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being served", ["method"], multiprocess_mode="livesum"
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency",
+    ["command", "collection", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+THREADPOOL_IN_USE = Gauge(
+    "threadpool_tokens_in_use", "Sync handlers/dependencies currently running in the threadpool",
+    multiprocess_mode="livesum"
+)
+THREADPOOL_SIZE = Gauge("threadpool_tokens_total", "Threadpool capacity", multiprocess_mode="livesum")
+THREADPOOL_WAITING = Gauge(
+    "threadpool_tasks_waiting", "Calls queued for a threadpool slot", multiprocess_mode="livesum"
+)
+SMTP_LATENCY = Histogram(
+    "smtp_send_duration_seconds", "Time to hand one message to the SMTP server", ["outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+OUTBOUND_LATENCY = Histogram(
+    "outbound_request_duration_seconds", "Third-party HTTP calls (reCAPTCHA, Google certs)",
+    ["target", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5),
+)
+MAIL_MESSAGES = Counter("mail_messages_total", "Mail queue outcomes", ["outcome"])
+STARTUP_SECONDS = Gauge("startup_phase_seconds", "Time spent in each startup phase", ["phase"],
+                        multiprocess_mode="max")
+
+
+# ======================================================
+#  HTTP
+# ======================================================
+class MetricsMiddleware:
+    """Plain ASGI middleware so streaming responses are timed without buffering."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.labels(method).dec()
+            # the matched route template keeps label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.labels(method, path, str(status["code"])).observe(time.perf_counter() - start)
+
+
+# ======================================================
+#  MONGODB
+# ======================================================
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (event.command_name, collection)
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            command, collection = self._pending.pop((event.connection_id, event.request_id),
+                                                    (event.command_name, ""))
+        MONGO_LATENCY.labels(command, collection, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+monitoring.register(MongoCommandMetrics())
+
+
+# ======================================================
+#  THREADPOOL
+# ======================================================
+def sample_threadpool():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    THREADPOOL_IN_USE.set(stats.borrowed_tokens)
+    THREADPOOL_SIZE.set(limiter.total_tokens)
+    THREADPOOL_WAITING.set(stats.tasks_waiting)
+
+
+# ======================================================
+#  ENDPOINT
+# ======================================================
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+    sample_threadpool()
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
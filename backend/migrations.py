@@ -0,0 +1,215 @@
+# =======================================
+# migrations.py
+# Resumable data migrations. Each one streams the documents that still
+# need changing in _id order, writes them back with bulk_write, and
+# checkpoints the last _id in the `migrations` collection so an
+# interrupted run picks up where it stopped.
+#
+#   python -m backend.migrations list
+#   python -m backend.migrations dry-run [id ...]
+#   python -m backend.migrations run [id ...]
+#   python -m backend.migrations verify [id ...]
+# =======================================
+
+from datetime import datetime
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+import os
+import time
+
+
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+COMPLETE_RECHECK_SECONDS = 60
+
+from backend.db import client, db
+migrations_col = db["migrations"]
+
+_complete: dict = {}  # id -> True, or the monotonic time of the last negative check
+
+
+class Migration:
+    """
+    `query` selects documents that still need migrating; `transform(doc)`
+    returns the write ops for one document; `verify()` returns a list of
+    problems (empty when the migration is fully applied).
+    """
+
+    def __init__(self, id: str, collection: str, description: str, query: dict,
+                 transform, verify=None, projection: dict = None):  # type: ignore
+        self.id = id
+        self.col = db[collection]
+        self.description = description
+        self.query = query
+        self.transform = transform
+        self.projection = projection
+        self._verify = verify
+
+    def remaining(self) -> int:
+        return self.col.count_documents(self.query)
+
+    def verify(self) -> list:
+        problems = []
+        left = self.remaining()
+        if left:
+            problems.append(f"{left} documents not migrated")
+        if self._verify:
+            problems.extend(self._verify())
+        return problems
+
+
+# ======================================================
+#  MIGRATIONS
+# ======================================================
+def _string_id(doc: dict) -> list:
+    # ordered writes: the old document is only removed once its copy exists;
+    # an upsert keeps a re-run after a crash between the two harmless
+    return [ReplaceOne({"_id": str(doc["_id"])}, {**doc, "_id": str(doc["_id"])}, upsert=True),
+            DeleteOne({"_id": doc["_id"]})]
+
+
+def _email_lower(doc: dict) -> list:
+    return [UpdateOne({"_id": doc["_id"]}, {"$set": {"email_lower": doc["email"].strip().lower()}})]
+
+
+def email_conflicts() -> list:
+    """Emails that differ only by case — these block the unique index until merged by hand."""
+    return list(db["user"].aggregate([
+        {"$match": {"email_lower": {"$type": "string"}}},
+        {"$group": {"_id": "$email_lower", "usernames": {"$push": "$username"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]))
+
+
+REQUEST_STRING_IDS = "admin_requests.string_ids"
+REPLY_STRING_IDS = "admin_replies.string_ids"
+USER_EMAIL_LOWER = "users.email_lower"
+
+REGISTRY = {m.id: m for m in (
+    Migration(
+        REQUEST_STRING_IDS, "admin_requests",
+        "Convert legacy ObjectId _ids on admin requests to strings",
+        {"_id": {"$type": "objectId"}}, _string_id,
+    ),
+    # the second collection the old convert_ids.py script rewrote
+    Migration(
+        REPLY_STRING_IDS, "admin_replies",
+        "Convert legacy ObjectId _ids on admin replies to strings",
+        {"_id": {"$type": "objectId"}}, _string_id,
+    ),
+    Migration(
+        USER_EMAIL_LOWER, "user",
+        "Add a lower-cased email_lower key to every user",
+        {"email": {"$type": "string"}, "email_lower": {"$exists": False}}, _email_lower,
+        verify=lambda: [f"duplicate email {c['_id']}: {', '.join(map(str, c['usernames']))}"
+                        for c in email_conflicts()],
+        projection={"email": 1},
+    ),
+)}
+
+
+# ======================================================
+#  RUNNER
+# ======================================================
+def _after(query: dict, last_id) -> dict:
+    if last_id is None:
+        return query
+    id_cond = query.get("_id")
+    id_cond = {**id_cond, "$gt": last_id} if isinstance(id_cond, dict) else {"$gt": last_id}
+    return {**query, "_id": id_cond}
+
+
+def run(migration_id: str, dry_run: bool = False, batch_size: int = BATCH_SIZE) -> dict:
+    m = REGISTRY[migration_id]
+    state = migrations_col.find_one({"_id": m.id}) or {}
+    last_id = None if dry_run else state.get("checkpoint")
+
+    if not dry_run:
+        migrations_col.update_one(
+            {"_id": m.id},
+            {"$set": {"status": "running", "description": m.description},
+             "$setOnInsert": {"started_at": datetime.utcnow(), "processed": 0}},
+            upsert=True
+        )
+
+    processed = 0
+    while True:
+        batch = list(m.col.find(_after(m.query, last_id), m.projection)
+                     .sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        processed += len(batch)
+        if dry_run:
+            continue
+
+        ops = [op for doc in batch for op in m.transform(doc)]
+        m.col.bulk_write(ops, ordered=True)
+        migrations_col.update_one(
+            {"_id": m.id},
+            {"$set": {"checkpoint": last_id, "updated_at": datetime.utcnow()},
+             "$inc": {"processed": len(batch)}}
+        )
+
+    problems = m.verify() if not dry_run else []
+    if not dry_run:
+        fields = {"status": "completed" if not problems else "needs_attention",
+                  "problems": problems[:20]}
+        unset = {"checkpoint": ""}
+        if problems:
+            unset["completed_at"] = ""
+        else:
+            fields["completed_at"] = datetime.utcnow()
+        # the next run starts from the top again; migrated documents no longer match the query
+        migrations_col.update_one({"_id": m.id}, {"$set": fields, "$unset": unset})
+        _complete.pop(m.id, None)
+
+    return {"id": m.id, "dry_run": dry_run, "processed": processed, "problems": problems}
+
+
+def verify(migration_id: str) -> list:
+    return REGISTRY[migration_id].verify()
+
+
+def is_complete(migration_id: str) -> bool:
+    """Recorded as completed; positive answers are cached for the life of the process."""
+    cached = _complete.get(migration_id)
+    if cached is True:
+        return True
+    if cached is not None and time.monotonic() - cached < COMPLETE_RECHECK_SECONDS:
+        return False
+
+    done = migrations_col.find_one({"_id": migration_id, "completed_at": {"$exists": True}}, {"_id": 1}) is not None
+    _complete[migration_id] = True if done else time.monotonic()
+    return done
+
+
+def status() -> list:
+    recorded = {d["_id"]: d for d in migrations_col.find({"_id": {"$in": list(REGISTRY)}})}
+    return [{"id": m.id, "description": m.description,
+             "status": recorded.get(m.id, {}).get("status", "pending"),
+             "completed_at": recorded.get(m.id, {}).get("completed_at")} for m in REGISTRY.values()]
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    ids = sys.argv[2:] or list(REGISTRY)
+
+    if command == "list":
+        for s in status():
+            print(f"{s['id']:<28} {s['status']:<16} {s['description']}")
+    elif command in ("run", "dry-run"):
+        for mid in ids:
+            report = run(mid, dry_run=command == "dry-run")
+            verb = "would migrate" if report["dry_run"] else "migrated"
+            print(f"{mid}: {verb} {report['processed']} documents")
+            for p in report["problems"]:
+                print(f"  ! {p}")
+    elif command == "verify":
+        for mid in ids:
+            problems = verify(mid)
+            print(f"{mid}: {'ok' if not problems else 'FAILED'}")
+            for p in problems:
+                print(f"  ! {p}")
+    else:
+        sys.exit(f"unknown command {command!r} (list, dry-run, run, verify)")
@@ -6,7 +6,6 @@ from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 from datetime import date, datetime
 
-from zmq import Enum
 # ==========================
 # TOKEN RESPONSE MODEL
 # ==========================
@@ -0,0 +1,314 @@
+# =======================================
+# notifications.py
+# Pushes admin-request and reply events to open dashboards over SSE.
+# Events come from MongoDB change streams when the server has them
+# (replica set / Atlas). On a standalone server the handlers write them
+# to a small capped collection that every worker tails, so clients on
+# any worker see them; if even that is unavailable they only reach this
+# process, and GET /notifications reports mode "local" so dashboards
+# keep polling.
+# =======================================
+
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from jose import jwt
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from backend import sessions
+from backend.auth_utils import get_current_user
+
+logger = logging.getLogger("notifications")
+router = APIRouter()
+
+HEARTBEAT_SECONDS = float(os.getenv("NOTIFY_HEARTBEAT_SECONDS", "15"))
+# streams are closed after this long and the browser reconnects; keeps a
+# server shutdown from waiting on idle connections and re-checks the token
+MAX_STREAM_SECONDS = float(os.getenv("NOTIFY_MAX_STREAM_SECONDS", "300"))
+QUEUE_SIZE = 100
+ADMIN_ROLES = ("admin", "super_admin")
+EVENTS_BYTES = int(os.getenv("NOTIFY_EVENTS_BYTES", str(1024 * 1024)))
+# a reconnecting tail re-reads this far back (ids are stamped by each
+# worker's clock); events already delivered are skipped by id
+EVENTS_OVERLAP_SECONDS = 30
+SEEN_IDS = 1000
+
+from backend.db import client, db
+requests_col = db["admin_requests"]
+replies_col = db["adminreplies"]
+events_col = db["notification_events"]
+
+_loop: asyncio.AbstractEventLoop = None  # type: ignore
+_subscribers: dict = {}          # queue -> (username, role)
+_listeners: list = []            # server-side callbacks, run for every event
+_stop = threading.Event()
+_watchers: list = []
+_mode = "local"                  # "change_stream" | "shared" | "local"
+_dropped = 0
+
+
+# ======================================================
+#  EVENTS
+# ======================================================
+def request_event(doc: dict, op: str) -> dict:
+    return {
+        "type": "request_created" if op == "insert" else "request_updated",
+        "username": doc.get("username"),
+        "request": {
+            "_id": str(doc.get("_id")),
+            "username": doc.get("username"),
+            "type": doc.get("type"),
+            "title": doc.get("title"),
+            "status": doc.get("status"),
+            "requested_at": doc.get("requested_at"),
+        },
+    }
+
+
+def reply_event(doc: dict) -> dict:
+    return {
+        "type": "reply",
+        "username": doc.get("username"),
+        "reply": {
+            "request_id": doc.get("request_id"),
+            "admin": doc.get("admin"),
+            "reply": doc.get("reply"),
+            "request_title": doc.get("request_title"),
+            "sent_at": doc.get("sent_at"),
+        },
+    }
+
+
+def _wants(event: dict, username: str, role: str) -> bool:
+    # admins see everything; users only what concerns them
+    return role in ADMIN_ROLES or event.get("username") == username
+
+
+def _dispatch(event: dict):
+    global _dropped
+    for callback in _listeners:
+        try:
+            callback(event)
+        except Exception as e:
+            logger.warning("Notification listener failed: %s", e)
+
+    for queue, (username, role) in list(_subscribers.items()):
+        if _wants(event, username, role):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                _dropped += 1  # slow client; it reloads on reconnect
+
+
+def _emit(event: dict):
+    """Hand an event to the event loop from any thread."""
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_dispatch, event)
+
+
+def on_event(callback):
+    """Register a callback run (on the event loop) for every event."""
+    _listeners.append(callback)
+
+
+def _publish(event: dict):
+    if _mode == "change_stream":
+        return  # the watchers pick the write up
+    if _mode == "shared":
+        try:
+            events_col.insert_one({"event": event})
+            return
+        except Exception as e:
+            logger.warning("Could not share notification, delivering locally: %s", e)
+    _emit(event)
+
+
+def publish_request(doc: dict, op: str = "insert"):
+    _publish(request_event(doc, op))
+
+
+def publish_reply(doc: dict):
+    _publish(reply_event(doc))
+
+
+# ======================================================
+#  CHANGE STREAMS
+# ======================================================
+def _watch(col, pipeline: list, to_event):
+    """Blocking loop on one collection's change stream, resuming after errors."""
+    resume_token = None
+    while not _stop.is_set():
+        try:
+            with col.watch(pipeline, full_document="updateLookup",
+                           resume_after=resume_token, max_await_time_ms=1000) as stream:
+                while not _stop.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    resume_token = stream.resume_token
+                    doc = change.get("fullDocument")
+                    if doc:
+                        _emit(to_event(doc, change["operationType"]))
+        except Exception as e:
+            if _stop.is_set():
+                break
+            logger.warning("Change stream on %s interrupted: %s", col.name, e)
+            _stop.wait(2)
+
+
+# ======================================================
+#  SHARED EVENTS (standalone servers, several workers)
+# ======================================================
+def _create_events_collection() -> bool:
+    try:
+        db.create_collection(events_col.name, capped=True, size=EVENTS_BYTES)
+    except CollectionInvalid:
+        pass  # created by another worker
+    except Exception as e:
+        logger.warning("Capped event collection unavailable (%s); events stay in this process", e)
+        return False
+    return bool(events_col.options().get("capped"))
+
+
+def _tail():
+    """Blocking loop over the capped collection with a tailable cursor."""
+    seen = deque(maxlen=SEEN_IDS)
+    since = datetime.now(timezone.utc)
+    while not _stop.is_set():
+        try:
+            # unfiltered: a tailable cursor whose first batch matches nothing is closed at once.
+            # The collection is small, so (re)opening reads it from the start and skips old events.
+            start = since - timedelta(seconds=EVENTS_OVERLAP_SECONDS)
+            cursor = events_col.find(cursor_type=CursorType.TAILABLE_AWAIT, max_await_time_ms=1000)
+            while cursor.alive and not _stop.is_set():
+                doc = cursor.try_next()
+                if doc is None or doc["_id"] in seen or doc["_id"].generation_time < start:
+                    continue
+                seen.append(doc["_id"])
+                since = max(since, doc["_id"].generation_time)
+                _emit(doc["event"])
+        except Exception as e:
+            if _stop.is_set():
+                break
+            logger.warning("Notification tail interrupted: %s", e)
+        _stop.wait(1)  # also reached when the collection is still empty
+
+
+# ======================================================
+#  STARTUP
+# ======================================================
+def _change_streams_supported() -> bool:
+    try:
+        with requests_col.watch(max_await_time_ms=1):
+            return True
+    except Exception as e:
+        logger.info("Change streams unavailable (%s); sharing events through a capped collection", e)
+        return False
+
+
+def _start_thread(target, args, name):
+    t = threading.Thread(target=target, args=args, name=name, daemon=True)
+    t.start()
+    _watchers.append(t)
+
+
+def _start_watchers():
+    global _mode
+    if _change_streams_supported():
+        if _stop.is_set():
+            return
+        # a reply also stamps last_reply_at on its request; the reply event covers that update
+        ops = [{"$match": {"$or": [
+            {"operationType": {"$in": ["insert", "replace"]}},
+            {"operationType": "update", "updateDescription.updatedFields.last_reply_at": {"$exists": False}},
+        ]}}]
+        inserts = [{"$match": {"operationType": "insert"}}]
+        _start_thread(_watch, (requests_col, ops, request_event), f"watch-{requests_col.name}")
+        _start_thread(_watch, (replies_col, inserts, lambda doc, op: reply_event(doc)),
+                      f"watch-{replies_col.name}")
+        _mode = "change_stream"
+    elif _create_events_collection() and not _stop.is_set():
+        _start_thread(_tail, (), f"tail-{events_col.name}")
+        _mode = "shared"
+
+
+def start():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    _stop.clear()
+    if _watchers:
+        return
+    # the probe waits on server selection; keep it off the startup path.
+    # Handlers publish in-process events until the watchers take over.
+    threading.Thread(target=_start_watchers, name="watch-probe", daemon=True).start()
+
+
+async def stop():
+    global _mode
+    _stop.set()
+    for t in _watchers:
+        await asyncio.to_thread(t.join, 5)
+    _watchers.clear()
+    _mode = "local"
+    # wake every open stream so its response can finish
+    for queue in list(_subscribers):
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+def stats() -> dict:
+    return {"mode": _mode, "subscribers": len(_subscribers), "dropped": _dropped}
+
+
+# ======================================================
+#  SSE ENDPOINT
+# ======================================================
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@router.get("/notifications")
+def notification_status(current_user: dict = Depends(get_current_user)):
+    """How events are delivered; in "local" mode clients should keep polling."""
+    return stats()
+
+
+@router.get("/notifications/stream")
+async def notification_stream(request: Request, token: str):
+    # EventSource cannot send headers, so the token comes in the query string
+    user = await asyncio.to_thread(get_current_user, token)
+    jti = jwt.get_unverified_claims(token).get("jti")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _subscribers[queue] = (user["username"], user.get("role", "user"))
+
+    async def events():
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected() or sessions.is_revoked(jti):
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield _sse(event)
+        finally:
+            _subscribers.pop(queue, None)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,142 @@
+# =======================================
+# outbound.py
+# Shared async HTTP client for third-party verification calls
+# (reCAPTCHA, Google sign-in certs) with a timeout, circuit breaker
+# and an in-process cache of Google's signing certs.
+# =======================================
+
+import asyncio
+import os
+import re
+import time
+from typing import TYPE_CHECKING
+
+from backend import metrics
+
+# httpx is only needed once a sign-up or Google login calls out; keep it off the import path
+if TYPE_CHECKING:
+    import httpx
+
+RECAPTCHA_VERIFY_URL = os.getenv("RECAPTCHA_VERIFY_URL", "https://www.google.com/recaptcha/api/siteverify")
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_TIMEOUT", "3"))
+BREAKER_THRESHOLD = int(os.getenv("OUTBOUND_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("OUTBOUND_BREAKER_COOLDOWN", "30"))
+DEFAULT_CERTS_MAX_AGE = 300
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency that has been failing."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+
+    def check(self):
+        if self.failures >= self.threshold and time.monotonic() < self.open_until:
+            raise CircuitOpen(f"{self.name} circuit open")
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            # half-open after the cooldown: the next call is let through as a probe
+            self.open_until = time.monotonic() + self.cooldown
+
+
+recaptcha_breaker = CircuitBreaker("recaptcha")
+google_certs_breaker = CircuitBreaker("google_certs")
+
+_client: "httpx.AsyncClient" = None  # type: ignore
+_certs: dict = {"value": None, "expires": 0.0}
+_certs_lock = asyncio.Lock()
+
+
+def get_client() -> "httpx.AsyncClient":
+    import httpx
+
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _client
+
+
+async def aclose():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None  # type: ignore
+
+
+async def _call(breaker: CircuitBreaker, method: str, url: str, **kwargs) -> "httpx.Response":
+    import httpx
+
+    breaker.check()
+    start = time.perf_counter()
+    try:
+        res = await get_client().request(method, url, **kwargs)
+        res.raise_for_status()
+    except httpx.HTTPError:
+        metrics.OUTBOUND_LATENCY.labels(breaker.name, "error").observe(time.perf_counter() - start)
+        breaker.failure()
+        raise
+    metrics.OUTBOUND_LATENCY.labels(breaker.name, "ok").observe(time.perf_counter() - start)
+    breaker.success()
+    return res
+
+
+# ============================================================
+# reCAPTCHA
+# ============================================================
+async def recaptcha_siteverify(secret: str, token: str) -> dict:
+    res = await _call(recaptcha_breaker, "POST", RECAPTCHA_VERIFY_URL,
+                      data={"secret": secret, "response": token})
+    return res.json()
+
+
+# ============================================================
+# Google sign-in
+# ============================================================
+def _max_age(cache_control: str) -> int:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else DEFAULT_CERTS_MAX_AGE
+
+
+async def google_certs() -> dict:
+    """Google's PEM signing certs keyed by kid, cached for the response's max-age."""
+    if _certs["value"] and time.monotonic() < _certs["expires"]:
+        return _certs["value"]
+
+    async with _certs_lock:
+        if _certs["value"] and time.monotonic() < _certs["expires"]:
+            return _certs["value"]
+
+        res = await _call(google_certs_breaker, "GET", GOOGLE_CERTS_URL)
+        _certs["value"] = res.json()
+        _certs["expires"] = time.monotonic() + _max_age(res.headers.get("cache-control", ""))
+        return _certs["value"]
+
+
+async def verify_google_id_token(token: str, audience: str) -> dict:
+    """Same checks as google.oauth2.id_token.verify_oauth2_token, minus the per-call cert fetch."""
+    from google.auth import jwt as google_jwt
+
+    certs = await google_certs()
+    idinfo = google_jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=10)
+
+    if idinfo.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {idinfo.get('iss')}")
+
+    return idinfo
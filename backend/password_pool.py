@@ -0,0 +1,163 @@
+# =======================================
+# password_pool.py
+# Runs PBKDF2 in a bounded process pool so a burst of logins cannot
+# occupy the request threadpool with CPU-bound hashing.
+# =======================================
+
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+
+# Cost factor for new hashes. Existing hashes keep the count they were stored with.
+ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "200000"))
+
+# 0 workers runs hashing inline (scripts, single-core dev boxes)
+WORKERS = int(os.getenv("PBKDF2_WORKERS", str(os.cpu_count() or 1)))
+
+# Hashes allowed in flight (running + queued) before callers are turned away
+MAX_PENDING = int(os.getenv("PBKDF2_MAX_PENDING", str(max(WORKERS, 1) * 4)))
+TIMEOUT_SECONDS = float(os.getenv("PBKDF2_TIMEOUT", "10"))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class PoolSaturated(Exception):
+    """Raised when MAX_PENDING hashes are already in flight or a hash times out."""
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    # Pools do not survive fork; each worker process builds its own
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(
+                    max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard(pool: ProcessPoolExecutor):
+    """Drop a pool whose worker died so the next call builds a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(password: str, salt: bytes, iterations: int):
+    """Queue one hash. The slot is held until the hash really finishes, not until the caller gives up."""
+    if not _slots.acquire(blocking=False):
+        raise PoolSaturated()
+    try:
+        for attempt in (1, 2):
+            pool = _get_pool()
+            try:
+                future = pool.submit(hashlib.pbkdf2_hmac, "sha256", password.encode(), salt, iterations)
+                break
+            except BrokenProcessPool:
+                _discard(pool)
+                if attempt == 2:
+                    raise
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return pool, future
+
+
+def derive(password: str, salt: bytes, iterations: int, _retry: bool = True) -> bytes:
+    if WORKERS <= 0:
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+    pool, future = _submit(password, salt, iterations)
+    try:
+        return future.result(timeout=TIMEOUT_SECONDS)
+    except FutureTimeout:
+        future.cancel()
+        raise PoolSaturated()
+    except BrokenProcessPool:
+        # a worker died mid-hash (OOM kill, crash); rebuild once
+        _discard(pool)
+        if not _retry:
+            raise
+        return derive(password, salt, iterations, _retry=False)
+
+
+async def derive_async(password: str, salt: bytes, iterations: int, _retry: bool = True) -> bytes:
+    """derive() for async handlers: waits on the event loop instead of holding a threadpool thread."""
+    if WORKERS <= 0:
+        return await asyncio.to_thread(hashlib.pbkdf2_hmac, "sha256", password.encode(), salt, iterations)
+
+    pool, future = _submit(password, salt, iterations)
+    try:
+        # on timeout wait_for cancels the wrapper, which cancels the future if it has not started
+        return await asyncio.wait_for(asyncio.wrap_future(future), TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise PoolSaturated()
+    except BrokenProcessPool:
+        _discard(pool)
+        if not _retry:
+            raise
+        return await derive_async(password, salt, iterations, _retry=False)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# =======================================
+# Benchmark: python -m backend.password_pool [seconds]
+# =======================================
+def _benchmark(seconds: float = 5.0):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    salt = os.urandom(16)
+    deadline = time.perf_counter() + seconds
+    done = 0
+    rejected = 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal done, rejected
+        while time.perf_counter() < deadline:
+            try:
+                derive("Benchmark@123", salt, ITERATIONS)
+                with lock:
+                    done += 1
+            except PoolSaturated:
+                with lock:
+                    rejected += 1
+                time.sleep(0.001)
+
+    derive("warmup", salt, 1)  # start the pool outside the timed window
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_PENDING) as threads:
+        for _ in range(MAX_PENDING):
+            threads.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    cores = max(WORKERS, 1)
+    print(f"iterations={ITERATIONS} workers={WORKERS} max_pending={MAX_PENDING}")
+    print(f"hashes: {done} in {elapsed:.2f}s → {done / elapsed:.1f} logins/s, "
+          f"{done / elapsed / cores:.1f} logins/s per core (rejected {rejected})")
+    shutdown()
+
+
+if __name__ == "__main__":
+    import sys
+    _benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
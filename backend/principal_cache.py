@@ -0,0 +1,89 @@
+# =======================================
+# principal_cache.py
+# Bounded LRU + TTL cache of resolved users, keyed by token subject.
+# Each worker has its own; changes made on another worker reach it through
+# sessions.invalidate_principals().
+# =======================================
+
+from collections import OrderedDict
+import os
+import threading
+import time
+
+MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+_entries: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+# invalidate() during a load must win over that load's (possibly stale) result:
+# every invalidation gets a number, and a load only caches if none for its key
+# is newer than the load. Forgotten numbers raise _floor, which blocks all older loads.
+_generation = 0
+_invalidated: "OrderedDict[str, int]" = OrderedDict()
+_floor = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def resolve(username: str, loader):
+    """
+    Return a copy of the cached user document for `username`, calling
+    `loader(username)` on a miss or after TTL. Missing users are not cached.
+    """
+    now = time.monotonic()
+
+    with _lock:
+        entry = _entries.get(username)
+        if entry and entry[0] > now:
+            _entries.move_to_end(username)
+            _stats["hits"] += 1
+            return dict(entry[1])
+        _stats["misses"] += 1
+        started = _generation
+
+    user = loader(username)
+    if not user:
+        return None
+
+    with _lock:
+        if _invalidated.get(username, 0) > started or _floor > started:
+            return dict(user)  # changed while loading; the next lookup reloads
+        _entries[username] = (now + TTL_SECONDS, user)
+        _entries.move_to_end(username)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+    return dict(user)
+
+
+def invalidate(*usernames: str):
+    global _generation, _floor
+    with _lock:
+        for username in usernames:
+            _generation += 1
+            _invalidated[username] = _generation
+            _invalidated.move_to_end(username)
+            if _entries.pop(username, None) is not None:
+                _stats["invalidations"] += 1
+        while len(_invalidated) > MAX_ENTRIES:
+            _floor = max(_floor, _invalidated.popitem(last=False)[1])
+
+
+def clear():
+    global _generation, _floor
+    with _lock:
+        _entries.clear()
+        _generation += 1
+        _floor = _generation
+
+
+def stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "size": len(_entries),
+            "max_size": MAX_ENTRIES,
+            "ttl_seconds": TTL_SECONDS,
+            "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,258 @@
+# =======================================
+# profiling.py
+# On-demand profiling of a single request. An admin adds `X-Profile: 1`
+# (or `?profile=1`) to any call and gets back a pyinstrument flame graph
+# plus the MongoDB commands the request issued instead of the normal
+# response. `X-Profile: store` keeps the normal response and writes the
+# report to PROFILE_DIR, returning its id in `X-Profile-Id`.
+# Off unless PROFILING_ENABLED=true.
+#
+# Like metrics.py this registers a pymongo listener, so main.py imports
+# it before anything that creates a MongoClient.
+# =======================================
+
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from pymongo import monitoring
+import asyncio
+import html
+import importlib
+import json
+import logging
+import os
+import time
+import uuid
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("profiling")
+
+ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+ADMIN_ROLES = ("admin", "super_admin")
+
+# read commands keep their filter/pipeline so slow queries can be matched
+# to an index; writes only record timing (their payloads carry user data)
+READ_COMMANDS = {"find": ("filter", "sort", "projection", "limit"), "aggregate": ("pipeline",),
+                 "count": ("query",), "distinct": ("key", "query")}
+MAX_DETAIL = 1000
+
+_commands: ContextVar = ContextVar("profile_commands", default=None)
+_sessions: ContextVar = ContextVar("profile_sessions", default=None)
+
+
+# ======================================================
+#  MONGO COMMANDS FOR THE PROFILED REQUEST
+# ======================================================
+class CommandRecorder(monitoring.CommandListener):
+    """Appends to the current request's list; a no-op outside profiled requests."""
+
+    def started(self, event):
+        commands = _commands.get()
+        if commands is None:
+            return
+        target = event.command.get(event.command_name)
+        entry = {"request_id": event.request_id, "command": event.command_name,
+                 "collection": target if isinstance(target, str) else "", "duration_ms": None}
+        keys = READ_COMMANDS.get(event.command_name, ())
+        detail = {k: event.command[k] for k in keys if k in event.command}
+        if detail:
+            entry["detail"] = json.dumps(detail, default=str)[:MAX_DETAIL]
+        commands.append(entry)
+
+    def _finish(self, event, ok: bool):
+        commands = _commands.get()
+        if commands is None:
+            return
+        for entry in reversed(commands):
+            if entry["request_id"] == event.request_id and entry["duration_ms"] is None:
+                entry["duration_ms"] = round(event.duration_micros / 1000, 3)
+                entry["ok"] = ok
+                break
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+monitoring.register(CommandRecorder())
+
+
+# ======================================================
+#  THREADPOOL CALLS
+# ======================================================
+# Most handlers and dependencies here are sync and run in the threadpool,
+# which a profiler started on the event loop thread cannot see. While a
+# request is being profiled, each threadpool call gets its own profiler and
+# its session is merged into the request's report.
+#
+# FastAPI has no hook for this, so install() swaps the run_in_threadpool its
+# routing and dependency modules imported. That is an internal detail, so it
+# only happens when profiling is enabled (from the lifespan, not at import),
+# and a FastAPI release that moves it just leaves sync frames out of reports.
+_PATCHED_MODULES = ("fastapi.routing", "fastapi.dependencies.utils")
+_originals: dict = {}
+
+def _profiled_call(sessions: list, func, *args, **kwargs):
+    from pyinstrument import Profiler
+
+    profiler = Profiler(interval=SAMPLE_INTERVAL, async_mode="disabled")
+    profiler.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sessions.append(profiler.stop())
+
+
+async def _run_in_threadpool(func, *args, **kwargs):
+    sessions = _sessions.get()
+    if sessions is None:
+        return await run_in_threadpool(func, *args, **kwargs)
+    return await run_in_threadpool(_profiled_call, sessions, func, *args, **kwargs)
+
+
+def install():
+    for name in _PATCHED_MODULES:
+        if name in _originals:
+            continue
+        module = importlib.import_module(name)
+        if not hasattr(module, "run_in_threadpool"):
+            logger.warning("%s.run_in_threadpool not found; profiles will miss threadpool frames", name)
+            continue
+        _originals[name] = module.run_in_threadpool
+        module.run_in_threadpool = _run_in_threadpool
+
+
+def uninstall():
+    for name, original in _originals.items():
+        importlib.import_module(name).run_in_threadpool = original
+    _originals.clear()
+
+
+# ======================================================
+#  REPORT
+# ======================================================
+def _is_admin(token: str) -> bool:
+    from backend.user import get_current_user
+
+    try:
+        return get_current_user(token).get("role") in ADMIN_ROLES
+    except Exception:
+        return False
+
+
+def _bearer(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token if scheme.lower() == "bearer" else ""
+    return ""
+
+
+def _requested_mode(scope) -> str:
+    """'' when not requested, else 'inline' or 'store'."""
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return "store" if value.decode("latin-1").lower() == "store" else "inline"
+    query = scope.get("query_string", b"").decode("latin-1")
+    for pair in query.split("&"):
+        if pair in ("profile=1", "profile=true"):
+            return "inline"
+        if pair == "profile=store":
+            return "store"
+    return ""
+
+
+def render_report(session, commands: list, meta: dict) -> str:
+    from pyinstrument.renderers import HTMLRenderer
+
+    page = HTMLRenderer().render(session)
+    total_ms = sum(c["duration_ms"] or 0 for c in commands)
+    rows = "".join(
+        f"<tr><td>{html.escape(c['command'])}</td><td>{html.escape(c['collection'])}</td>"
+        f"<td>{c['duration_ms']}</td><td><code>{html.escape(c.get('detail', ''))}</code></td></tr>"
+        for c in commands
+    )
+    summary = (
+        f"<section style='font-family:monospace;padding:1em;background:#fff;color:#000'>"
+        f"<h3>{html.escape(meta['method'])} {html.escape(meta['path'])} → {meta['status']} "
+        f"in {meta['duration_ms']} ms</h3>"
+        f"<p>{len(commands)} MongoDB commands, {round(total_ms, 3)} ms</p>"
+        f"<table border=1 cellpadding=4><tr><th>command</th><th>collection</th><th>ms</th><th>detail</th></tr>"
+        f"{rows}</table></section>"
+    )
+    return page.replace("</body>", summary + "</body>", 1)
+
+
+def store_report(profile_id: str, report: str, commands: list, meta: dict):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    (PROFILE_DIR / f"{profile_id}.html").write_text(report)
+    (PROFILE_DIR / f"{profile_id}.json").write_text(json.dumps({**meta, "commands": commands}, indent=2))
+    logger.info("Stored profile %s for %s %s", profile_id, meta["method"], meta["path"])
+
+
+# ======================================================
+#  MIDDLEWARE
+# ======================================================
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        mode = _requested_mode(scope) if ENABLED and scope["type"] == "http" else ""
+        # non-admins get the normal response; the flag is not acknowledged
+        if not mode or not await asyncio.to_thread(_is_admin, _bearer(scope)):
+            return await self.app(scope, receive, send)
+
+        from pyinstrument import Profiler
+        from pyinstrument.session import Session
+
+        profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        commands, sessions = [], []
+        status = {"code": 500}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if mode == "store":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-profile-id", profile_id.encode())]}
+            if mode == "store":
+                await send(message)
+
+        commands_token = _commands.set(commands)
+        sessions_token = _sessions.set(sessions)
+        profiler = Profiler(interval=SAMPLE_INTERVAL, async_mode="enabled")
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            session = profiler.stop()
+            _commands.reset(commands_token)
+            _sessions.reset(sessions_token)
+
+        for threaded in sessions:
+            session = Session.combine(session, threaded)
+        meta = {"method": scope["method"], "path": scope["path"], "status": status["code"],
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "at": datetime.now(timezone.utc).isoformat()}
+        report = await anyio.to_thread.run_sync(render_report, session, commands, meta)
+
+        if mode == "store":
+            await anyio.to_thread.run_sync(store_report, profile_id, report, commands, meta)
+            return
+
+        body = report.encode("utf-8")
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/html; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-profile-status", str(status["code"]).encode()),
+            (b"x-profile-mongo-commands", str(len(commands)).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
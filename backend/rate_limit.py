@@ -0,0 +1,166 @@
+# =======================================
+# rate_limit.py
+# Sliding-window throttles for the auth endpoints. They run before any
+# PBKDF2 or reCAPTCHA work, so abusive traffic is turned away cheaply.
+# =======================================
+
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+import math
+import os
+import threading
+import time
+
+BUCKETS = 10
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()  # "memory" or "mongo"
+
+
+def _parse(spec: str):
+    """'10/300' → (10 requests, 300 seconds)"""
+    limit, window = spec.split("/", 1)
+    return int(limit), float(window)
+
+
+# ======================================================
+#  IN-PROCESS BACKEND
+# ======================================================
+class SlidingWindow:
+    """
+    Approximate sliding window: the window is cut into BUCKETS slots kept in a
+    ring per key (two small int arrays), so memory per key is constant.
+    Least recently used keys are dropped past MAX_KEYS.
+    """
+
+    def __init__(self, limit: int, window: float, buckets: int = BUCKETS, max_keys: int = MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.buckets = buckets
+        self.width = window / buckets
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> float:
+        """Count one request. Returns 0 if allowed, else seconds until retry."""
+        slot = int(time.time() / self.width)
+        pos = slot % self.buckets
+
+        with self._lock:
+            ring = self._keys.get(key)
+            if ring is None:
+                ring = (array("I", [0] * self.buckets), array("q", [0] * self.buckets))
+                self._keys[key] = ring
+                if len(self._keys) > self.max_keys:
+                    self._keys.popitem(last=False)
+            else:
+                self._keys.move_to_end(key)
+
+            counts, slots = ring
+            if slots[pos] != slot:
+                counts[pos] = 0
+                slots[pos] = slot
+
+            oldest = slot - self.buckets
+            total = sum(c for c, s in zip(counts, slots) if s > oldest)
+            if total >= self.limit:
+                # next slot boundary frees the oldest bucket
+                return max((slot + 1) * self.width - time.time(), 1.0)
+
+            counts[pos] += 1
+            return 0.0
+
+
+# ======================================================
+#  SHARED BACKEND (all workers count together)
+# ======================================================
+class MongoSlidingWindow:
+    """Same slotted window, stored as one small TTL document per key and slot."""
+
+    def __init__(self, name: str, limit: int, window: float, buckets: int = BUCKETS):
+        from backend.db import db
+
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.buckets = buckets
+        self.width = window / buckets
+        self.col = db["rate_limits"]
+
+    def ensure_indexes(self):
+        self.col.create_index("expires_at", expireAfterSeconds=0)
+        self.col.create_index([("k", 1), ("slot", 1)])
+
+    def hit(self, key: str) -> float:
+        slot = int(time.time() / self.width)
+        k = f"{self.name}:{key}"
+
+        # earlier slots are closed; only the current one is still being counted
+        rows = self.col.find({"k": k, "slot": {"$gt": slot - self.buckets, "$lt": slot}}, {"n": 1})
+        earlier = sum(r["n"] for r in rows)
+        if earlier >= self.limit:
+            return max((slot + 1) * self.width - time.time(), 1.0)
+
+        # count first, then decide: concurrent workers each get a distinct count back,
+        # so no more than `limit` of them can pass
+        current = self.col.find_one_and_update(
+            {"_id": f"{k}:{slot}"},
+            {"$inc": {"n": 1},
+             "$setOnInsert": {"k": k, "slot": slot,
+                              "expires_at": datetime.utcnow() + timedelta(seconds=self.window + self.width)}},
+            projection={"n": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if earlier + current["n"] > self.limit:
+            # rejected attempts are not counted, as in the in-process window
+            self.col.update_one({"_id": f"{k}:{slot}"}, {"$inc": {"n": -1}})
+            return max((slot + 1) * self.width - time.time(), 1.0)
+        return 0.0
+
+
+def _limiter(name: str, env: str, default: str):
+    limit, window = _parse(os.getenv(env, default))
+    if BACKEND == "mongo":
+        return MongoSlidingWindow(name, limit, window)
+    return SlidingWindow(limit, window)
+
+
+# Failed-or-not, every attempt counts: the cost we protect is the attempt itself
+login_by_account = _limiter("login_account", "RATE_LIMIT_LOGIN_ACCOUNT", "10/300")
+login_by_ip = _limiter("login_ip", "RATE_LIMIT_LOGIN_IP", "50/300")
+# sending and checking a code are limited separately, so a few typos do not also
+# use up the resends (RATE_LIMIT_OTP_ACCOUNT is the older name for the send limit)
+otp_send_by_account = _limiter("otp_send_account", "RATE_LIMIT_OTP_SEND_ACCOUNT",
+                               os.getenv("RATE_LIMIT_OTP_ACCOUNT", "5/600"))
+otp_verify_by_account = _limiter("otp_verify_account", "RATE_LIMIT_OTP_VERIFY_ACCOUNT", "10/600")
+otp_by_ip = _limiter("otp_ip", "RATE_LIMIT_OTP_IP", "20/600")
+
+
+def ensure_indexes():
+    for limiter in (login_by_account, login_by_ip, otp_send_by_account, otp_verify_by_account, otp_by_ip):
+        if isinstance(limiter, MongoSlidingWindow):
+            limiter.ensure_indexes()
+
+
+def client_ip(request: Request) -> str:
+    # X-Forwarded-For is not read here: its leftmost entry is whatever the client sent.
+    # uvicorn (proxy_headers, FORWARDED_ALLOW_IPS in serve.py) already replaces the
+    # peer address with the forwarded one when the connection comes from a trusted proxy.
+    return request.client.host if request.client else "unknown"
+
+
+def check(request: Request, account: str, by_account, by_ip):
+    """Raise 429 if either the client IP or the target account is over its limit."""
+    retry = by_ip.hit(client_ip(request))
+    if not retry and account:
+        retry = by_account.hit(account.strip().lower())
+    if retry:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts. Please try again later.",
+            headers={"Retry-After": str(math.ceil(retry))}
+        )
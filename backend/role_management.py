@@ -3,18 +3,15 @@
 # =======================================
 
 from fastapi import APIRouter, Depends, HTTPException, Body
-from pymongo import MongoClient
 import os
-from dotenv import load_dotenv
 
 from backend.auth_utils import get_current_user, require_role, send_email
+from backend import sessions, audit
 
-load_dotenv()
 router = APIRouter()
 
 # DB
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("MONGO_DB_APP")] # type: ignore
+from backend.db import client, db
 users = db["user"]
 
 ALLOWED = ["admin", "manager", "editor", "viewer", "user"]
@@ -46,6 +43,8 @@ async def set_role(username: str, data: dict = Body(...), current_user=Depends(g
         {"username": username},
         {"$set": {"role": new_role}}
     )
+    sessions.invalidate_principals(username)
+    audit.record("set_role", current_user["username"], username, old_role=old_role, role=new_role)
 
     # Send email notification and report status
     email_sent = False
@@ -0,0 +1,106 @@
+# =======================================
+# serve.py
+# Production launcher: `python -m backend.serve`.
+# Runs one uvicorn worker per available CPU (WEB_CONCURRENCY overrides),
+# on uvloop/httptools when installed, and drains in-flight requests on
+# SIGTERM for up to GRACEFUL_TIMEOUT seconds before cancelling them (SSE
+# streams included; browsers reconnect to a live worker).
+#
+# Workers are spawned, not forked, so each imports the app fresh and
+# opens its own Mongo and PBKDF2 pools on first use. Per-worker state
+# that must agree across workers goes through Mongo: rate limits use the
+# shared backend whenever there is more than one worker, and the
+# principal cache is invalidated everywhere through sessions.py.
+# main.py's `__main__` stays the single-process reload server for development.
+# =======================================
+
+import importlib.util
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on: the affinity mask, capped by a cgroup v2 quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS/Windows
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+CPUS = available_cpus()
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(CPUS)))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "20"))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "5"))
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+ACCESS_LOG = os.getenv("ACCESS_LOG", "false").lower() == "true"
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def prepare_worker_env() -> str:
+    """Settings the spawned workers inherit. Returns a metrics dir to clean up, if one was made."""
+    # every worker has its own PBKDF2 pool; split the CPUs instead of each taking all of them
+    os.environ.setdefault("PBKDF2_WORKERS", str(max(1, CPUS // WORKERS)))
+
+    # in-process windows would give each worker its own count, loosening every limit N times
+    if WORKERS > 1:
+        if os.getenv("RATE_LIMIT_BACKEND", "mongo").lower() != "mongo":
+            sys.exit("RATE_LIMIT_BACKEND=memory cannot be used with WEB_CONCURRENCY > 1")
+        os.environ["RATE_LIMIT_BACKEND"] = "mongo"
+
+    # /metrics must aggregate across workers, which prometheus_client does through a shared dir
+    if WORKERS > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        path = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+        return path
+    return ""
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    metrics_dir = prepare_worker_env()
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+    logger.info("Starting %d worker(s) on %s:%d (%d CPUs available, loop=%s, http=%s)",
+                WORKERS, HOST, PORT, CPUS, loop, http)
+    try:
+        uvicorn.run(
+            "backend.main:app",
+            host=HOST,
+            port=PORT,
+            workers=WORKERS,
+            loop=loop,
+            http=http,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+            timeout_keep_alive=KEEPALIVE_TIMEOUT,
+            proxy_headers=True,
+            forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+            access_log=ACCESS_LOG,
+        )
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# =======================================
+# sessions.py
+# Login sessions (one document per issued token, keyed by jti) and the
+# in-memory set of revoked jtis every worker checks on each request.
+# The same refresh carries principal-cache invalidations between workers.
+# =======================================
+
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import threading
+
+from backend import principal_cache
+
+logger = logging.getLogger("sessions")
+
+REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "2"))
+# revoked_at is stamped by whichever worker revoked, so clocks can disagree and a
+# write can land after a later-stamped one was read. Each refresh re-reads this
+# far behind the newest revocation it has seen; must exceed the worst clock skew.
+SKEW_MARGIN = timedelta(seconds=float(os.getenv("REVOCATION_SKEW_SECONDS", "60")))
+
+from backend.db import client, db
+sessions_col = db["logged_sessions"]
+invalidations_col = db["principal_invalidations"]
+
+# jti -> token expiry; entries are dropped once the token would have expired anyway
+_revoked: dict = {}
+_revoked_lock = threading.Lock()
+_last_seen = datetime.min
+_last_invalidation = datetime.utcnow()  # cache entries from before startup do not exist yet
+_seen_invalidations: set = set()
+_worker: asyncio.Task = None  # type: ignore
+
+
+def ensure_indexes():
+    # Mongo removes each session when its token expires
+    sessions_col.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+    sessions_col.create_index("jti", unique=True, sparse=True, name="jti_unique")
+    sessions_col.create_index("revoked_at", sparse=True, name="revoked_at")
+    sessions_col.create_index([("username", 1), ("logged_at", -1)], name="username_logged_at")
+    invalidations_col.create_index("at", name="at")
+    invalidations_col.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+
+    # sessions recorded before expiry was tracked: give them the token lifetime
+    sessions_col.update_many(
+        {"expires_at": {"$exists": False}, "logged_at": {"$type": "date"}},
+        [{"$set": {"expires_at": {"$add": ["$logged_at", 10 * 3600 * 1000]}}}]
+    )
+
+
+def record_session(user: dict, jti: str, expires_at: datetime, login_method: str):
+    now = datetime.utcnow()
+    sessions_col.insert_one({
+        "jti": jti,
+        "username": user["username"],
+        "email": user.get("email"),
+        "role": user.get("role", "user"),
+        "ts": int(now.timestamp() * 1000),
+        "logged_at": now,
+        "expires_at": expires_at,
+        "login_method": login_method
+    })
+
+
+def revoke(query: dict) -> int:
+    """Revoke every live session matching `query`. Returns how many were revoked."""
+    now = datetime.utcnow()
+    live = {**query, "revoked_at": {"$exists": False}}
+    docs = list(sessions_col.find(live, {"jti": 1, "expires_at": 1}))
+    if not docs:
+        return 0
+
+    sessions_col.update_many({"_id": {"$in": [d["_id"] for d in docs]}}, {"$set": {"revoked_at": now}})
+
+    # this worker knows immediately; the others pick it up on their next refresh
+    with _revoked_lock:
+        for d in docs:
+            if d.get("jti"):
+                _revoked[d["jti"]] = d.get("expires_at") or now
+    return len(docs)
+
+
+def invalidate_principals(*usernames: str):
+    """Drop cached user documents here now and on every other worker at its next refresh."""
+    usernames = [u for u in usernames if u]
+    if not usernames:
+        return
+    principal_cache.invalidate(*usernames)
+    now = datetime.utcnow()
+    # kept until every worker's overlap window has passed it
+    expires = now + SKEW_MARGIN + timedelta(seconds=REFRESH_SECONDS) + timedelta(minutes=5)
+    invalidations_col.insert_many([{"username": u, "at": now, "expires_at": expires} for u in usernames])
+
+
+def refresh_invalidations():
+    global _last_invalidation
+    docs = list(invalidations_col.find({"at": {"$gte": _last_invalidation - SKEW_MARGIN}},
+                                       {"username": 1, "at": 1}).sort("at", 1))
+    fresh = [d for d in docs if d["_id"] not in _seen_invalidations]
+    if fresh:
+        principal_cache.invalidate(*(d["username"] for d in fresh))
+    # only ids still inside the overlap window can come back
+    _seen_invalidations.intersection_update(d["_id"] for d in docs)
+    _seen_invalidations.update(d["_id"] for d in fresh)
+    if docs:
+        _last_invalidation = max(_last_invalidation, docs[-1]["at"])
+
+
+def is_revoked(jti: str) -> bool:
+    return bool(jti) and jti in _revoked
+
+
+def refresh_revocations():
+    """Pull revocations recorded since the last refresh and drop expired entries."""
+    global _last_seen
+    now = datetime.utcnow()
+
+    # re-reading the overlap is harmless: entries are keyed by jti
+    since = _last_seen - SKEW_MARGIN if _last_seen - datetime.min > SKEW_MARGIN else datetime.min
+    docs = list(
+        sessions_col.find({"revoked_at": {"$gte": since}}, {"jti": 1, "expires_at": 1, "revoked_at": 1})
+        .sort("revoked_at", 1)
+    )
+
+    with _revoked_lock:
+        for d in docs:
+            if d.get("jti"):
+                _revoked[d["jti"]] = d.get("expires_at") or now
+        if docs:
+            _last_seen = max(_last_seen, docs[-1]["revoked_at"])
+        for jti in [j for j, exp in _revoked.items() if exp < now]:
+            del _revoked[jti]
+
+
+async def run_worker():
+    while True:
+        try:
+            await asyncio.to_thread(refresh_revocations)
+            await asyncio.to_thread(refresh_invalidations)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Revocation refresh failed: %s", e)
+        await asyncio.sleep(REFRESH_SECONDS)
+
+
+def start():
+    global _worker
+    if _worker is None or _worker.done():
+        _worker = asyncio.get_running_loop().create_task(run_worker())
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None  # type: ignore
+
+
+def stats() -> dict:
+    with _revoked_lock:
+        return {"revoked_tokens": len(_revoked), "last_refresh_watermark": _last_seen.isoformat()}
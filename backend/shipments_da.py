@@ -1,25 +1,103 @@
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Body
-from pymongo import MongoClient
+from fastapi import APIRouter, Depends, HTTPException, Body, Response
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from datetime import datetime, date, timezone
-from auth_utils import get_current_user, require_role
+from backend.auth_utils import get_current_user, require_role
+from backend import audit, streaming
 from pydantic import BaseModel, Field, validator
-import os, re
-from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, UpdateMany, DeleteMany
+import os, re, time, threading, logging
 
 from backend.models import ShipmentCreate, ShipmentUpdate
-from backend.db import get_db
-load_dotenv()
+from backend.db import get_db, client, db
 
 router = APIRouter()
 
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB = os.getenv("MONGO_DB_APP")
-
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB] # type: ignore
 shipments_collection = db["shipments"]
 
+# Identifier fields users look shipments up by. Their lower-cased values are
+# kept in `search_keys` so a prefix search is an indexed range scan.
+SEARCH_FIELDS = ["shipment_number", "container_number", "po_number", "delivery_number", "batch_id"]
+SEARCH_MAX_LIMIT = 100
+
+# Dashboard stats are polled every few seconds; keep each scope's result briefly
+STATS_CACHE_TTL = float(os.getenv("SHIPMENT_STATS_TTL", "5"))
+STATS_TOP_ROUTES = 10
+_stats_cache: dict = {}
+_stats_lock = threading.Lock()
+
+
+def ensure_indexes():
+    try:
+        shipments_collection.create_index("shipment_number", unique=True, name="shipment_number_unique")
+    except OperationFailure as e:
+        # existing duplicates must be cleaned up by hand before uniqueness can be enforced
+        logging.warning("shipment_number unique index not created: %s", e)
+
+    shipments_collection.create_index(
+        [("created_by", ASCENDING), ("search_keys", ASCENDING)], name="created_by_search_keys"
+    )
+    shipments_collection.create_index([("search_keys", ASCENDING)], name="search_keys")
+    shipments_collection.create_index(
+        [("created_by", ASCENDING), ("created_at", DESCENDING)], name="created_by_created_at"
+    )
+    shipments_collection.create_index(
+        [("created_by", ASCENDING), ("status", ASCENDING)], name="created_by_status"
+    )
+
+    # Backfill shipments created before search_keys existed (server-side, one call)
+    shipments_collection.update_many(
+        {"search_keys": {"$exists": False}},
+        [{"$set": {"search_keys": {"$setDifference": [
+            [{"$toLower": {"$trim": {"input": {"$toString": f"${f}"}}}} for f in SEARCH_FIELDS],
+            [""]
+        ]}}}]
+    )
+
+
+def build_search_keys(doc: dict) -> list:
+    return sorted({str(doc[f]).strip().lower() for f in SEARCH_FIELDS if doc.get(f)})
+
+
+def scope_query(current_user: dict) -> dict:
+    """Admins see every shipment, everyone else only their own."""
+    if current_user.get("role", "user").lower() == "admin":
+        return {}
+    return {"created_by": current_user["username"]}
+
+
+def format_shipment(r: dict) -> dict:
+    return {
+        "shipment_number": r.get("shipment_number"),
+        "container_number": r.get("container_number"),
+        "route_from": r.get("route_from"),
+        "route_to": r.get("route_to"),
+        "goods_type": r.get("goods_type"),
+        "shipment_priority": r.get("shipment_priority"),
+        "shipment_health":   r.get("shipment_health"),
+        "device":            r.get("device"),
+        "device_id":         r.get("device_id"),
+        "po_number":         r.get("po_number"),
+        "ndc_number":        r.get("ndc_number"),
+        "serial_number_goods": r.get("serial_number_goods"),
+        "delivery_number":   r.get("delivery_number"),
+        "batch_id":          r.get("batch_id"),
+        "shipment_description": r.get("shipment_description"),
+        "expected_delivery_date": (
+            r["expected_delivery_date"].strftime("%Y-%m-%d")
+            if isinstance(r.get("expected_delivery_date"), datetime)
+            else r.get("expected_delivery_date")
+        ),
+        "created_at": (
+            r["created_at"].isoformat()
+            if isinstance(r.get("created_at"), datetime)
+            else r.get("created_at")
+        ),
+        "created_by": r.get("created_by"),
+        "status": r.get("status"),
+    }
+
+
 def serialize_shipment(doc: dict) -> dict:
     """Convert MongoDB doc to API-friendly JSON-serializable dict."""
     doc["id"] = str(doc.pop("_id"))
@@ -27,11 +105,8 @@ def serialize_shipment(doc: dict) -> dict:
 # =========================
 # CREATE
 # =========================
-@router.post("/api/shipments/create")
-def create_shipment( # type: ignore
-    shipment: ShipmentCreate = Body(...),
-    current_user: dict = Depends(get_current_user)
-):
+def insert_shipment(shipment: ShipmentCreate, **fields) -> dict:
+    """Build the stored document for a new shipment and insert it; 409 on a taken number."""
     doc = shipment.dict()
 
     if isinstance(doc.get("expected_delivery_date"), date):
@@ -39,18 +114,32 @@ def create_shipment( # type: ignore
             doc["expected_delivery_date"], datetime.min.time()
         )
 
-    doc.update({
-        "created_by": current_user["username"],
-        "user_email": current_user.get("email"),
-        "status": "active",
-        "created_at": datetime.utcnow()
-    })
+    doc.update(fields)
+    doc["search_keys"] = build_search_keys(doc)
+
+    try:
+        shipments_collection.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(409, f"Shipment number '{doc['shipment_number']}' already exists")
+    return doc
 
-    result = shipments_collection.insert_one(doc)
+
+@router.post("/api/shipments/create")
+def create_shipment( # type: ignore
+    shipment: ShipmentCreate = Body(...),
+    current_user: dict = Depends(get_current_user)
+):
+    doc = insert_shipment(
+        shipment,
+        created_by=current_user["username"],
+        user_email=current_user.get("email"),
+        status="active",
+        created_at=datetime.utcnow()
+    )
 
     return {
         "message": "Shipment created",
-        "shipment_id": str(result.inserted_id)
+        "shipment_id": str(doc["_id"])
     }
 
 
@@ -58,141 +147,146 @@ def create_shipment( # type: ignore
 # READ (GET ALL)
 # =========================
 @router.get("/api/shipments")
-def get_shipments(current_user: dict = Depends(get_current_user)):
+def get_shipments(format: str = None, current_user: dict = Depends(get_current_user)):  # type: ignore
 
-    role = current_user.get("role", "user").lower()
+    records = shipments_collection.find(scope_query(current_user)).sort("created_at", -1)
 
-    if role == "admin":
-        records = list(shipments_collection.find().sort("created_at", -1))
-    else:
-        records = list(
-            shipments_collection.find(
-                {"created_by": current_user["username"]}
-            ).sort("created_at", -1)
-        )
+    if streaming.check_format(format):
+        return streaming.respond(format, "records", (format_shipment(r) for r in records))
+    return {"records": [format_shipment(r) for r in records]}
+
+# =========================
+# SEARCH (prefix match on identifiers, paged)
+# =========================
+@router.get("/api/shipments/search")
+def search_shipments(
+    q: str,
+    page: int = 1,
+    limit: int = 25,
+    current_user: dict = Depends(get_current_user)
+):
+    term = q.strip().lower()
+    if not term:
+        raise HTTPException(400, "Search term required")
+
+    page = max(page, 1)
+    limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+
+    # Anchored, case-sensitive regex on the lower-cased keys → index range scan
+    query = scope_query(current_user)
+    query["search_keys"] = {"$regex": "^" + re.escape(term)}
+
+    # find keeps the index range scan and sorts with a top-k bound of skip+limit;
+    # the same stages inside $facet sorted every match and were capped at 100MB
+    records = (shipments_collection.find(query)
+               .sort("created_at", -1)
+               .skip((page - 1) * limit)
+               .limit(limit))
+
+    return {
+        "records": [format_shipment(r) for r in records],
+        "total": shipments_collection.count_documents(query),
+        "page": page,
+        "limit": limit
+    }
+
+# =========================
+# STATS (counts for the dashboard)
+# =========================
+def _counts(facet_rows: list) -> dict:
+    return {row["_id"]: row["count"] for row in facet_rows if row["_id"]}
+
+
+def compute_shipment_stats(query: dict) -> dict:
+    def count_by(expr, limit=None):
+        stages = [{"$group": {"_id": expr, "count": {"$sum": 1}}}, {"$sort": {"count": -1}}]
+        return stages + ([{"$limit": limit}] if limit else [])
+
+    def lower(field):
+        return {"$toLower": {"$ifNull": [f"${field}", ""]}}
+
+    result = next(shipments_collection.aggregate([
+        {"$match": query},
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "status": count_by(lower("status")),
+            "priority": count_by(lower("shipment_priority")),
+            "health": count_by(lower("shipment_health")),
+            # shipments without any route would otherwise show up as a " → " bucket
+            "route": [{"$match": {"$or": [{"route_from": {"$nin": [None, ""]}},
+                                          {"route_to": {"$nin": [None, ""]}}]}}]
+                     + count_by({"$concat": [
+                         {"$ifNull": ["$route_from", ""]}, " → ", {"$ifNull": ["$route_to", ""]}
+                     ]}, STATS_TOP_ROUTES)
+        }}
+    ]))
+
+    return {
+        "total": result["total"][0]["n"] if result["total"] else 0,
+        "status": _counts(result["status"]),
+        "priority": _counts(result["priority"]),
+        "health": _counts(result["health"]),
+        "route": _counts(result["route"]),
+    }
 
-    output = []
-
-    for r in records:
-        output.append({
-            "shipment_number": r.get("shipment_number"),
-            "container_number": r.get("container_number"),
-            "route_from": r.get("route_from"),
-            "route_to": r.get("route_to"),
-            "goods_type": r.get("goods_type"),
-            "shipment_priority": r.get("shipment_priority"),
-            "shipment_health":   r.get("shipment_health"),
-            "device":            r.get("device"),
-            "device_id":         r.get("device_id"),
-            "po_number":         r.get("po_number"),
-            "ndc_number":        r.get("ndc_number"),
-            "serial_number_goods": r.get("serial_number_goods"),
-            "delivery_number":   r.get("delivery_number"),
-            "batch_id":          r.get("batch_id"),
-            "shipment_description": r.get("shipment_description"),
-            "expected_delivery_date": (
-                r["expected_delivery_date"].strftime("%Y-%m-%d")
-                if isinstance(r.get("expected_delivery_date"), datetime)
-                else r.get("expected_delivery_date")
-            ),
-            "created_at": (
-                r["created_at"].isoformat()
-                if isinstance(r.get("created_at"), datetime)
-                else r.get("created_at")
-            ),
-            "created_by": r.get("created_by"),
-            "status": r.get("status"),
-        })
-
-    return {"records": output}
+
+@router.get("/api/shipments/stats")
+def get_shipment_stats(current_user: dict = Depends(get_current_user)):
+    query = scope_query(current_user)
+    key = query.get("created_by", "*")
+    now = time.monotonic()
+
+    with _stats_lock:
+        cached = _stats_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    stats = compute_shipment_stats(query)
+
+    with _stats_lock:
+        # drop stale entries so the cache stays bounded by active users
+        for k in [k for k, (exp, _) in _stats_cache.items() if exp <= now]:
+            del _stats_cache[k]
+        _stats_cache[key] = (now + STATS_CACHE_TTL, stats)
+
+    return stats
 
 # =========================
 # READ (GET ALL) for ADMIN
 # =========================
 @router.get("/admin/shipments")
-def get_all_shipments_admin(current_user: dict = Depends(get_current_user)):
+def get_all_shipments_admin(format: str = None, current_user: dict = Depends(get_current_user)):  # type: ignore
     require_role(current_user, ["admin", "super_admin"])
     
-    records = list(shipments_collection.find().sort("created_at", -1))
-    
-    output = []
-    for r in records:
-        output.append({
-            "shipment_number": r.get("shipment_number"),
-            "container_number": r.get("container_number"),
-            "route_from": r.get("route_from"),
-            "route_to": r.get("route_to"),
-            "goods_type": r.get("goods_type"),
-            "shipment_priority": r.get("shipment_priority"),
-            "shipment_health": r.get("shipment_health"),
-            "device": r.get("device"),
-            "device_id": r.get("device_id"),
-            "po_number": r.get("po_number"),
-            "ndc_number": r.get("ndc_number"),
-            "serial_number_goods": r.get("serial_number_goods"),
-            "delivery_number": r.get("delivery_number"),
-            "batch_id": r.get("batch_id"),
-            "shipment_description": r.get("shipment_description"),
-            "expected_delivery_date": (
-                r["expected_delivery_date"].strftime("%Y-%m-%d")
-                if isinstance(r.get("expected_delivery_date"), datetime)
-                else r.get("expected_delivery_date")
-            ),
-            "created_at": (
-                r["created_at"].isoformat()
-                if isinstance(r.get("created_at"), datetime)
-                else r.get("created_at")
-            ),
-            "created_by": r.get("created_by"),
-            "status": r.get("status"),
-        })
-    
-    return {"records": output}
+    records = shipments_collection.find().sort("created_at", -1)
+
+    if streaming.check_format(format):
+        return streaming.respond(format, "records", (format_shipment(r) for r in records))
+    return {"records": [format_shipment(r) for r in records]}
 
 # =========================
 # READ (GET ONE)
 # =========================
 @router.get("/api/shipments/{shipment_number}")
 def get_shipment(shipment_number: str, current_user: dict = Depends(get_current_user)):
-    role = current_user.get("role", "user").lower()
-    
-    query = {"shipment_number": shipment_number}
-    if role != "admin":
-        query["created_by"] = current_user["username"]
-    
+    query = scope_query(current_user)
+    query["shipment_number"] = shipment_number
+
     record = shipments_collection.find_one(query)
     if not record:
         raise HTTPException(404, "Shipment not found")
-    
-    return {
-        "shipment_number": record.get("shipment_number"),
-        "container_number": record.get("container_number"),
-        "route_from": record.get("route_from"),
-        "route_to": record.get("route_to"),
-        "goods_type": record.get("goods_type"),
-        "shipment_priority": record.get("shipment_priority"),
-        "shipment_health": record.get("shipment_health"),
-        "device": record.get("device"),
-        "device_id": record.get("device_id"),
-        "po_number": record.get("po_number"),
-        "ndc_number": record.get("ndc_number"),
-        "serial_number_goods": record.get("serial_number_goods"),
-        "delivery_number": record.get("delivery_number"),
-        "batch_id": record.get("batch_id"),
-        "shipment_description": record.get("shipment_description"),
-        "expected_delivery_date": (
-            record["expected_delivery_date"].strftime("%Y-%m-%d")
-            if isinstance(record.get("expected_delivery_date"), datetime)
-            else record.get("expected_delivery_date")
-        ),
-        "created_at": (
-            record["created_at"].isoformat()
-            if isinstance(record.get("created_at"), datetime)
-            else record.get("created_at")
-        ),
-        "created_by": record.get("created_by"),
-        "status": record.get("status"),
-    }
+
+    return format_shipment(record)
+
+# =========================
+# EXISTS (duplicate check before create)
+# =========================
+@router.head("/api/shipments/{shipment_number}")
+def shipment_exists(shipment_number: str, current_user: dict = Depends(get_current_user)):
+    # Numbers are unique across all users, so the check is not scoped to created_by
+    if shipments_collection.find_one({"shipment_number": shipment_number}, {"_id": 1}) is None:
+        return Response(status_code=404)
+    return Response(status_code=200)
 
 # =========================
 # update shipment dispatch info 
@@ -247,15 +341,9 @@ async def update_dispatch(
 # create shipment with validation[admin]
 # =========================
 @router.post("/", status_code=201)
-async def create_shipment(payload: ShipmentCreate, db=Depends(get_db)):
-    data = payload.model_dump(exclude_none=True)
-    data["created_at"] = datetime.now(timezone.utc)
-    data["updated_at"] = datetime.now(timezone.utc)
-    data["updated_by"] = "admin"
-    data.setdefault("status", "Pending")
- 
-    result = await db["shipments"].insert_one(data)
-    created = await db["shipments"].find_one({"_id": result.inserted_id})
+def create_shipment_admin(payload: ShipmentCreate):
+    now = datetime.now(timezone.utc)
+    created = insert_shipment(payload, created_at=now, updated_at=now, updated_by="admin", status="Pending")
     return {
         "message": "Shipment created successfully",
         "shipment": serialize_shipment(created)
@@ -303,17 +391,15 @@ def cancel_shipment(
 
     return {"message": "Shipment cancelled"}
 # ======================================================
-#  ADMIN — PATCH SHIPMENT (status + priority+expected_delivery_date)
+#  ADMIN — BULK HELPERS
 # ======================================================
-@router.patch("/admin/shipments/{shipment_number}")
-def patch_shipment(shipment_number: str, data: dict,
-                   current_user=Depends(get_current_user)):
-    require_role(current_user, ["admin","super_admin"])
- 
-    doc = shipments_collection.find_one({"shipment_number": shipment_number})
-    if not doc:
-        raise HTTPException(404, f"Shipment '{shipment_number}' not found")
- 
+# Fields an admin may select shipments by in a bulk operation
+BULK_FILTER_FIELDS = ["status", "shipment_priority", "shipment_health", "created_by",
+                      "route_from", "route_to", "goods_type", "device_id"]
+BULK_MAX_SHIPMENTS = 1000
+
+
+def build_update_fields(data: dict) -> dict:
     update_fields = {}
     if "status" in data:
         update_fields["status"] = data["status"]
@@ -326,13 +412,98 @@ def patch_shipment(shipment_number: str, data: dict,
             update_fields["expected_delivery_date"] = datetime.strptime(
                 data["expected_delivery_date"], "%Y-%m-%d"
             )
-        except ValueError:
+        except (TypeError, ValueError):
             raise HTTPException(400, "Invalid date format for expected_delivery_date. Use YYYY-MM-DD.")
     if not update_fields:
         raise HTTPException(400, "No valid fields to update")
- 
-    shipments_collection.update_one({"_id": doc["_id"]}, {"$set": update_fields})
- 
+    return update_fields
+
+
+def build_bulk_query(data: dict) -> dict:
+    """Selects shipments by an explicit `shipment_numbers` list or a whitelisted `filter`."""
+    numbers = data.get("shipment_numbers")
+    flt = data.get("filter")
+
+    if bool(numbers) == bool(flt):
+        raise HTTPException(400, "Provide either shipment_numbers or filter")
+
+    if numbers:
+        if not isinstance(numbers, list) or not all(isinstance(n, str) for n in numbers):
+            raise HTTPException(400, "shipment_numbers must be a list of strings")
+        if len(numbers) > BULK_MAX_SHIPMENTS:
+            raise HTTPException(400, f"At most {BULK_MAX_SHIPMENTS} shipments per request")
+        return {"shipment_number": {"$in": numbers}}
+
+    if not isinstance(flt, dict):
+        raise HTTPException(400, "filter must be an object")
+
+    query = {}
+    for field, value in flt.items():
+        if field not in BULK_FILTER_FIELDS:
+            raise HTTPException(400, f"Cannot filter on '{field}'")
+        # plain values only, lists become $in — never raw operators from the client
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            query[field] = {"$in": value}
+        elif isinstance(value, str):
+            query[field] = value
+        else:
+            raise HTTPException(400, f"Invalid value for '{field}'")
+    return query
+
+# ======================================================
+#  ADMIN — BULK PATCH SHIPMENTS
+# ======================================================
+@router.patch("/admin/shipments/bulk")
+def bulk_patch_shipments(data: dict = Body(...), current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin","super_admin"])
+
+    query = build_bulk_query(data)
+    update_fields = build_update_fields(data.get("update") or {})
+
+    result = shipments_collection.bulk_write(
+        [UpdateMany(query, {"$set": update_fields})], ordered=False
+    )
+    audit.record("bulk_patch_shipments", current_user["username"], data.get("shipment_numbers"),
+                 filter=data.get("filter"), update=update_fields, modified=result.modified_count)
+
+    return {
+        "success": True,
+        "matched": result.matched_count,
+        "modified": result.modified_count,
+        "updated": update_fields
+    }
+
+# ======================================================
+#  ADMIN — BULK DELETE SHIPMENTS
+# ======================================================
+@router.delete("/admin/shipments/bulk")
+def bulk_delete_shipments(data: dict = Body(...), current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin","super_admin"])
+
+    query = build_bulk_query(data)
+
+    result = shipments_collection.bulk_write([DeleteMany(query)], ordered=False)
+    audit.record("bulk_delete_shipments", current_user["username"], data.get("shipment_numbers"),
+                 filter=data.get("filter"), deleted=result.deleted_count)
+
+    return {"success": True, "deleted": result.deleted_count}
+
+# ======================================================
+#  ADMIN — PATCH SHIPMENT (status + priority+expected_delivery_date)
+# ======================================================
+@router.patch("/admin/shipments/{shipment_number}")
+def patch_shipment(shipment_number: str, data: dict,
+                   current_user=Depends(get_current_user)):
+    require_role(current_user, ["admin","super_admin"])
+
+    update_fields = build_update_fields(data)
+
+    result = shipments_collection.update_one(
+        {"shipment_number": shipment_number}, {"$set": update_fields}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(404, f"Shipment '{shipment_number}' not found")
+
     return {"success": True, "updated": update_fields}
 # ======================================================
 #  ADMIN — PUT SHIPMENT (full update / same as PATCH)
@@ -0,0 +1,174 @@
+# =======================================
+# streaming.py
+# Streams large list responses straight from a Mongo cursor instead of
+# building the whole list first, and compresses responses on the way
+# out (brotli when the package is installed and the client accepts it,
+# otherwise gzip).
+#
+#   ?format=ndjson   one JSON object per line (application/x-ndjson)
+#   ?format=stream   the usual {"<key>": [...]} body, written item by item
+# =======================================
+
+from datetime import date, datetime
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+import json
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+FORMATS = ("ndjson", "stream")
+
+# Items are grouped into writes of about this size; each write is one threadpool hop.
+# The first write is small so the client sees data before a full chunk is ready.
+CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", "65536"))
+FIRST_CHUNK_BYTES = 4096
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # higher levels cost more CPU than they save on JSON
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "application/javascript",
+                "text/html", "text/css", "text/javascript", "text/plain", "image/svg+xml"}
+
+
+# ======================================================
+#  STREAMED LISTS
+# ======================================================
+def check_format(fmt: str):
+    if fmt is not None and fmt not in FORMATS:
+        raise HTTPException(400, f"format must be one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def _default(value):
+    # match FastAPI's encoding of the buffered responses (ISO dates, ObjectId as str)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(item) -> str:
+    return json.dumps(item, default=_default, separators=(",", ":"))
+
+
+def _ndjson(items):
+    for item in items:
+        yield _dumps(item) + "\n"
+
+
+def _array(key: str, items):
+    yield '{"%s":[' % key
+    separator = ""
+    for item in items:
+        yield separator + _dumps(item)
+        separator = ","
+    yield "]}"
+
+
+def _chunks(pieces):
+    buf, size, limit = [], 0, FIRST_CHUNK_BYTES
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= limit:
+            yield "".join(buf).encode("utf-8")
+            buf, size, limit = [], 0, CHUNK_BYTES
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def respond(fmt: str, key: str, items) -> StreamingResponse:
+    """Stream `items` (usually a generator over a cursor) in the requested format."""
+    if fmt == "ndjson":
+        return StreamingResponse(_chunks(_ndjson(items)), media_type="application/x-ndjson")
+    return StreamingResponse(_chunks(_array(key, items)), media_type="application/json")
+
+
+# ======================================================
+#  COMPRESSION
+# ======================================================
+def negotiate(accept_encoding: str) -> str:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return ""
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.brotli = encoding == "br"
+        if self.brotli:
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)  # type: ignore
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # intermediate chunks are flushed so streamed rows reach the client as they are written
+        if self.brotli:
+            return self._c.process(data) + (self._c.finish() if final else self._c.flush())
+        return self._c.compress(data) + self._c.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Compresses JSON/NDJSON/text bodies, buffered or streamed. SSE and binary pass through."""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def compressing_send(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            start = state["start"]
+
+            if state["compressor"] is None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if ("content-encoding" in headers or content_type not in COMPRESSIBLE
+                        or (not more and len(body) < self.minimum_size)):
+                    state["passthrough"] = True
+                    await send(start)
+                    return await send(message)
+
+                state["compressor"] = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more:
+                    body = state["compressor"].compress(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": body})
+                await send(start)
+
+            await send({"type": "http.response.body",
+                        "body": state["compressor"].compress(body, final=not more), "more_body": more})
+
+        await self.app(scope, receive, compressing_send)
@@ -1,20 +1,17 @@
-from fastapi import APIRouter, Form, HTTPException, Depends, Body
+from fastapi import APIRouter, Form, HTTPException, Depends, Body, Request
 from bson import ObjectId
 from pydantic import EmailStr,BaseModel
 from jose import jwt
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import os, hashlib, re, base64, hmac, requests,random, smtplib,json
-from google.auth.transport.requests import Request as GoogleRequest
-from google.oauth2 import id_token
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+import os, hashlib, re, base64, hmac, random, json, uuid
+import anyio
 from typing import Optional
 
 from backend.models import SignupOtpRequest, SignupVerifyOtpRequest
-load_dotenv()
+from backend import principal_cache, password_pool, outbound, mailer, sessions, rate_limit, audit
+from backend import migrations
+from backend.db import client, db
 
 router = APIRouter()
 
@@ -24,25 +21,31 @@ ALGORITHM = os.getenv("ALGORITHM")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY")
 RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY")
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB_APP = os.getenv("MONGO_DB_APP")
-
-# Email config
-MAIL_FROM = os.getenv("MAIL_FROM")
-MAIL_SERVER = os.getenv("MAIL_SERVER")
-MAIL_PORT = int(os.getenv("MAIL_PORT")) # type: ignore
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
-
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB_APP] # type: ignore
 users = db["user"]
 otp_col = db["otp_store"]
-sessions_col = db["logged_sessions"]
 oauth2 = OAuth2PasswordBearer(tokenUrl="login")
 # DB collections (add these after your existing db setup)
 shipments = db["shipments"]
 devices = db["devices"]
 
+
+def ensure_indexes():
+    # shipments.created_by is indexed by shipments_da.ensure_indexes
+    devices.create_index("created_by")
+
+    # pending OTPs (signup and password reset) disappear once expired
+    otp_col.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+    otp_col.create_index("email", name="email")
+
+    users.create_index("username")
+    if not migrations.is_complete(migrations.USER_EMAIL_LOWER):
+        migrations.run(migrations.USER_EMAIL_LOWER)
+    # fails (and is logged at startup) while case-only duplicate emails remain
+    users.create_index(
+        "email_lower", unique=True, name="email_lower_unique",
+        partialFilterExpression={"email_lower": {"$type": "string"}}
+    )
+
 # ============================================================
 # PASSWORD HELPERS
 # ============================================================
@@ -50,24 +53,64 @@ def hash_password(p: str) -> str:
     return hashlib.sha256(p.encode()).hexdigest()
 
 
-def pbkdf2_hash(password: str, iterations: int = 200_000) -> str:
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please try again shortly",
+        headers={"Retry-After": "1"}
+    )
+
+
+def _derive(password: str, salt: bytes, iterations: int) -> bytes:
+    try:
+        return password_pool.derive(password, salt, iterations)
+    except password_pool.PoolSaturated:
+        raise _busy()
+
+
+async def _derive_async(password: str, salt: bytes, iterations: int) -> bytes:
+    try:
+        return await password_pool.derive_async(password, salt, iterations)
+    except password_pool.PoolSaturated:
+        raise _busy()
+
+
+def pbkdf2_hash(password: str, iterations: int = None) -> str: # type: ignore
+    iterations = iterations or password_pool.ITERATIONS
     salt = os.urandom(16)
-    dk = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    dk = _derive(password, salt, iterations)
     return f"pbkdf2_sha256${iterations}${base64.b64encode(salt).decode()}${base64.b64encode(dk).decode()}"
 
 
-def pbkdf2_verify(stored: str, password: str) -> bool:
+def _parse_pbkdf2(stored: str):
+    """(salt, iterations, expected) for a well-formed hash, else None."""
     try:
         algo, iters, salt_b64, dk_b64 = stored.split("$", 3)
         if algo != "pbkdf2_sha256":
-            return False
-        iterations = int(iters)
-        salt = base64.b64decode(salt_b64)
-        expected = base64.b64decode(dk_b64)
-        dk = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
-        return hmac.compare_digest(dk, expected)
+            return None
+        return base64.b64decode(salt_b64), int(iters), base64.b64decode(dk_b64)
     except Exception:
+        return None
+
+
+def pbkdf2_verify(stored: str, password: str) -> bool:
+    parsed = _parse_pbkdf2(stored)
+    if not parsed:
+        return False
+    salt, iterations, expected = parsed
+
+    # a saturated pool surfaces as 503 rather than a failed login
+    dk = _derive(password, salt, iterations)
+    return hmac.compare_digest(dk, expected)
+
+
+async def pbkdf2_verify_async(stored: str, password: str) -> bool:
+    parsed = _parse_pbkdf2(stored)
+    if not parsed:
         return False
+    salt, iterations, expected = parsed
+    dk = await _derive_async(password, salt, iterations)
+    return hmac.compare_digest(dk, expected)
 
 
 def verify_and_migrate_password(user: dict, plain: str) -> bool:
@@ -82,14 +125,26 @@ def verify_and_migrate_password(user: dict, plain: str) -> bool:
         if hash_password(plain) == hashed:
             new_hash = pbkdf2_hash(plain)
             users.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+            sessions.invalidate_principals(user.get("username"))
             return True
 
     return False
 
 
+async def verify_and_migrate_password_async(user: dict, plain: str) -> bool:
+    hashed = user.get("password", "")
+    if isinstance(hashed, str) and hashed.startswith("pbkdf2_sha256$"):
+        return await pbkdf2_verify_async(hashed, plain)
+    # legacy hashes are upgraded once, on the sync path
+    return await anyio.to_thread.run_sync(verify_and_migrate_password, user, plain)
+
+
 # ============================================================
 # JWT TOKEN FIXED (FULL ROLE SUPPORT)
 # ============================================================
+TOKEN_TTL = timedelta(hours=10)
+
+
 def create_token(data: dict):
     payload = data.copy()
 
@@ -97,11 +152,29 @@ def create_token(data: dict):
     payload["role"] = data.get("role", "user")
     payload["sub"] = data.get("username")  # identity
 
-    payload["exp"] = datetime.utcnow() + timedelta(hours=10)
+    payload["jti"] = data.get("jti") or uuid.uuid4().hex
+    payload["exp"] = data.get("exp") or datetime.utcnow() + TOKEN_TTL
 
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM) # type: ignore
 
 
+def issue_session_token(user: dict, login_method: str) -> str:
+    """Create a token and record its session so it can be listed and revoked."""
+    jti = uuid.uuid4().hex
+    expires_at = datetime.utcnow() + TOKEN_TTL
+
+    token = create_token({
+        "username": user["username"],
+        "email": user.get("email"),
+        "role": user.get("role", "user"),
+        "jti": jti,
+        "exp": expires_at
+    })
+    sessions.record_session(user, jti, expires_at, login_method)
+
+    return token
+
+
 # ============================================================
 # CURRENT USER FIX (returns role always)
 # ============================================================
@@ -112,7 +185,10 @@ def get_current_user(token: str = Depends(oauth2)):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    user = users.find_one({"username": username})
+    if sessions.is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=401, detail="Session revoked")
+
+    user = principal_cache.resolve(username, lambda u: users.find_one({"username": u}))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
@@ -125,7 +201,7 @@ def get_current_user(token: str = Depends(oauth2)):
 # ============================================================
 # reCAPTCHA Verification
 # ============================================================
-def verify_recaptcha(token: str, action: str = None) -> bool: # type: ignore
+async def verify_recaptcha_async(token: str, action: str = None) -> bool: # type: ignore
 
     if not token:
         print("[reCAPTCHA] Empty token accepted (fallback mode)")
@@ -136,9 +212,7 @@ def verify_recaptcha(token: str, action: str = None) -> bool: # type: ignore
         return True
 
     try:
-        url = "https://www.google.com/recaptcha/api/siteverify"
-        res = requests.post(url, data={"secret": RECAPTCHA_SECRET_KEY, "response": token}, timeout=6)
-        data = res.json()
+        data = await outbound.recaptcha_siteverify(RECAPTCHA_SECRET_KEY, token)
 
         if not data.get("success"):
             print("[reCAPTCHA] Failed", data)
@@ -157,6 +231,11 @@ def verify_recaptcha(token: str, action: str = None) -> bool: # type: ignore
         return False
 
 
+def verify_recaptcha(token: str, action: str = None) -> bool: # type: ignore
+    """Sync handlers run in the threadpool; hop onto the event loop that owns the shared client."""
+    return anyio.from_thread.run(verify_recaptcha_async, token, action)
+
+
 # ============================================================
 # Validation Helpers
 # ============================================================
@@ -216,10 +295,27 @@ def get_my_devices(current_user: dict = Depends(get_current_user)):
 def get_my_dashboard(current_user: dict = Depends(get_current_user)):
     username = current_user["username"]
 
-    total_shipments = shipments.count_documents({"created_by": username})
-    active_shipments = shipments.count_documents({"created_by": username, "status": "active"})
-    delivered = shipments.count_documents({"created_by": username, "status": "delivered"})
-    total_devices = devices.count_documents({"created_by": username})
+    # One round-trip: this user's shipments unioned with their devices, counted in one $group
+    counts = next(shipments.aggregate([
+        {"$match": {"created_by": username}},
+        {"$project": {"_id": 0, "status": 1, "kind": "shipment"}},
+        {"$unionWith": {"coll": devices.name, "pipeline": [
+            {"$match": {"created_by": username}},
+            {"$project": {"_id": 0, "kind": "device"}}
+        ]}},
+        {"$group": {
+            "_id": None,
+            "total_shipments": {"$sum": {"$cond": [{"$eq": ["$kind", "shipment"]}, 1, 0]}},
+            "active_shipments": {"$sum": {"$cond": [{"$eq": ["$status", "active"]}, 1, 0]}},
+            "delivered": {"$sum": {"$cond": [{"$eq": ["$status", "delivered"]}, 1, 0]}},
+            "total_devices": {"$sum": {"$cond": [{"$eq": ["$kind", "device"]}, 1, 0]}}
+        }}
+    ]), {})
+
+    total_shipments = counts.get("total_shipments", 0)
+    active_shipments = counts.get("active_shipments", 0)
+    delivered = counts.get("delivered", 0)
+    total_devices = counts.get("total_devices", 0)
 
     return {
         "username": username,
@@ -233,21 +329,20 @@ def get_my_dashboard(current_user: dict = Depends(get_current_user)):
 # Helper: send OTP email
 # ============================================================
 def send_otp_email(to_email: str, otp: str, firstname: str):
-    msg = MIMEText(f"Hi {firstname},\n\nYour SCMXpertLite signup OTP is: {otp}\n\nValid for 10 minutes.")
-    msg["Subject"] = "Your SCMXpertLite Signup OTP"
-    msg["From"] = MAIL_FROM # type: ignore
-    msg["To"] = to_email
-    with smtplib.SMTP(MAIL_SERVER, MAIL_PORT) as smtp: # type: ignore
-        smtp.starttls()
-        smtp.login(MAIL_FROM, MAIL_PASSWORD) # type: ignore
-        smtp.sendmail(MAIL_FROM, to_email, msg.as_string()) # type: ignore
+    mailer.enqueue(
+        to_email,
+        "Your SCMXpertLite Signup OTP",
+        f"Hi {firstname},\n\nYour SCMXpertLite signup OTP is: {otp}\n\nValid for 10 minutes."
+    )
 
 # ============================================================
 # STEP 1 — Validate details, store temp, send OTP
 # ============================================================
 @router.post("/signup/send-otp")
-def signup_send_otp(data: SignupOtpRequest):
-    if users.find_one({"$or": [{"username": data.username}, {"email": data.email.lower()}]}):
+def signup_send_otp(data: SignupOtpRequest, request: Request):
+    rate_limit.check(request, data.email, rate_limit.otp_send_by_account, rate_limit.otp_by_ip)
+
+    if users.find_one({"$or": [{"username": data.username}, {"email_lower": data.email.strip().lower()}]}):
         raise HTTPException(status_code=400, detail="Username or email already exists")
 
     if not validate_password(data.password):
@@ -268,6 +363,7 @@ def signup_send_otp(data: SignupOtpRequest):
                 "lastname":  data.lastname,
                 "username":  data.username,
                 "email":     data.email.lower(),
+                "email_lower": data.email.strip().lower(),
                 "password":  pbkdf2_hash(data.password),
                 "role":      "user",
                 "created_at": datetime.utcnow()
@@ -287,7 +383,9 @@ def signup_send_otp(data: SignupOtpRequest):
 # STEP 2 — Verify OTP and create user
 # ============================================================
 @router.post("/signup/verify-otp")
-def signup_verify_otp(data: SignupVerifyOtpRequest):
+def signup_verify_otp(data: SignupVerifyOtpRequest, request: Request):
+    rate_limit.check(request, data.email, rate_limit.otp_verify_by_account, rate_limit.otp_by_ip)
+
     record = otp_col.find_one({"email": data.email.lower()})
 
     if not record:
@@ -301,50 +399,50 @@ def signup_verify_otp(data: SignupVerifyOtpRequest):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     pending = record["pending_user"]
+    # signups started before email_lower existed do not carry it yet
+    pending["email_lower"] = pending.get("email_lower") or pending["email"].strip().lower()
 
     # Final duplicate check
-    if users.find_one({"$or": [{"username": pending["username"]}, {"email": pending["email"]}]}):
+    if users.find_one({"$or": [{"username": pending["username"]}, {"email_lower": pending["email_lower"]}]}):
         raise HTTPException(status_code=400, detail="User already exists")
 
     users.insert_one(pending)
     otp_col.delete_one({"email": data.email.lower()})
+    audit.record("signup", pending["username"], auth_provider="email")
 
     return {"message": "Account created successfully"}
 # ============================================================
 # LOGIN  (FIXED with role + email)
 # ============================================================
 @router.post("/login")
-def login(
+async def login(
+    request: Request,
     username: str = Form(...),
     password: str = Form(...),
     recaptcha_token: str = Form(...)
 ):
+    # async so the PBKDF2 wait does not hold a threadpool thread; Mongo calls still go through it
 
-    if not verify_recaptcha(recaptcha_token, "login"):
+    # before reCAPTCHA and PBKDF2: throttled attempts cost no outbound call or hashing
+    await anyio.to_thread.run_sync(rate_limit.check, request, username,
+                                   rate_limit.login_by_account, rate_limit.login_by_ip)
+
+    if not await verify_recaptcha_async(recaptcha_token, "login"):
         raise HTTPException(status_code=401, detail="reCAPTCHA validation failed")
 
-    user = users.find_one({"$or": [{"username": username}, {"email": username}]} )
+    user = await anyio.to_thread.run_sync(
+        users.find_one, {"$or": [{"username": username}, {"email_lower": username.strip().lower()}]}
+    )
     if not user:
+        audit.record("login", username, request=request, outcome="unknown_user", method="password")
         raise HTTPException(status_code=401, detail="Invalid username/email")
 
-    if not verify_and_migrate_password(user, password):
+    if not await verify_and_migrate_password_async(user, password):
+        audit.record("login", user["username"], request=request, outcome="bad_password", method="password")
         raise HTTPException(status_code=401, detail="Invalid password")
 
-    token = create_token({
-        "username": user["username"],
-        "email": user.get("email"),
-        "role": user.get("role", "user")
-    })
-
-    now = datetime.utcnow()
-    sessions_col.insert_one({
-        "username": user["username"],
-        "email": user.get("email"),
-        "role": user.get("role", "user"),
-        "ts": int(now.timestamp() * 1000),
-        "logged_at": now,
-        "login_method": "password"
-    })
+    token = await anyio.to_thread.run_sync(issue_session_token, user, "password")
+    audit.record("login", user["username"], request=request, method="password")
 
     return {
         "access_token": token,
@@ -359,8 +457,11 @@ def login(
 # LOGOUT
 # ============================================================
 @router.post("/logout")
-def logout(current_user: dict = Depends(get_current_user)):
-    print(f"[LOGOUT] {current_user.get('username')} logged out")
+def logout(token: str = Depends(oauth2), current_user: dict = Depends(get_current_user)):
+    jti = jwt.get_unverified_claims(token).get("jti")  # already verified by get_current_user
+    if jti:
+        sessions.revoke({"jti": jti})
+    audit.record("logout", current_user.get("username"))
     return {"message": "Logged out"}
 
 
@@ -368,8 +469,8 @@ def logout(current_user: dict = Depends(get_current_user)):
 # reCAPTCHA DEBUG
 # ============================================================
 @router.post("/public/recaptcha-verify")
-def debug_verify_recaptcha(token: str = Form(...), action: str = Form(None)):
-    ok = verify_recaptcha(token, action)
+async def debug_verify_recaptcha(token: str = Form(...), action: str = Form(None)):
+    ok = await verify_recaptcha_async(token, action)
     return {"verified": bool(ok)}
 
 
@@ -377,7 +478,8 @@ def debug_verify_recaptcha(token: str = Form(...), action: str = Form(None)):
 # GOOGLE LOGIN (Auto-create)
 # ============================================================
 @router.post("/auth/google")
-def auth_google(payload: dict = Body(...)):
+def auth_google(request: Request, payload: dict = Body(...)):
+    rate_limit.check(request, "", rate_limit.login_by_account, rate_limit.login_by_ip)
 
     token = payload.get("token")
     recaptcha_token = payload.get("recaptcha_token", "")
@@ -389,8 +491,7 @@ def auth_google(payload: dict = Body(...)):
         raise HTTPException(401, "reCAPTCHA validation failed")
 
     try:
-        google_req = GoogleRequest()
-        idinfo = id_token.verify_oauth2_token(token, google_req, GOOGLE_CLIENT_ID)
+        idinfo = anyio.from_thread.run(outbound.verify_google_id_token, token, GOOGLE_CLIENT_ID)
     except Exception as e:
         raise HTTPException(400, f"Invalid Google token: {str(e)}")
 
@@ -406,11 +507,12 @@ def auth_google(payload: dict = Body(...)):
     google_sub = idinfo.get("sub")
     username = email.split("@")[0]
 
-    user = users.find_one({"email": email})
+    user = users.find_one({"email_lower": email.strip().lower()})
 
     if not user:
         new_user = {
             "email": email,
+            "email_lower": email.strip().lower(),
             "username": username,
             "fullname": fullname,
             "picture": picture,
@@ -435,13 +537,11 @@ def auth_google(payload: dict = Body(...)):
 
         if update_data:
             users.update_one({"_id": user["_id"]}, {"$set": update_data})
+            sessions.invalidate_principals(user["username"])
             user = users.find_one({"_id": user["_id"]})
 
-    jwt_token = create_token({
-        "username": user["username"], # type: ignore
-        "email": user["email"], # type: ignore
-        "role": user.get("role", "user") # type: ignore
-    })
+    jwt_token = issue_session_token(user, "google") # type: ignore
+    audit.record("login", user["username"], request=request, method="google") # type: ignore
 
     return {
         "access_token": jwt_token,
@@ -478,6 +578,7 @@ def update_profile(
         {"_id": current_user["_id"] if isinstance(current_user["_id"], ObjectId) else ObjectId(current_user["_id"])},
         {"$set": update_fields}
     )
+    sessions.invalidate_principals(current_user["username"])
 
     return {"message": "Profile updated successfully"}
 @router.get("/user/profile")
@@ -506,8 +607,11 @@ class ChangePasswordRequest(BaseModel):
 @router.post("/user/change-password")
 def change_password(
     data: ChangePasswordRequest,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
+    rate_limit.check(request, current_user["username"], rate_limit.login_by_account, rate_limit.login_by_ip)
+
     # Verify current password
     if not verify_and_migrate_password(current_user, data.current_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
@@ -525,6 +629,8 @@ def change_password(
         {"_id": current_user["_id"] if isinstance(current_user["_id"], ObjectId) else ObjectId(current_user["_id"])},
         {"$set": {"password": new_hash}}
     )
+    sessions.invalidate_principals(current_user["username"])
+    audit.record("change_password", current_user["username"], request=request)
 
     return {"message": "Password updated successfully"}
 
@@ -585,17 +691,7 @@ This export was requested from your account settings.
 """
 
     try:
-        msg = MIMEMultipart()
-        msg["Subject"] = "SCMXpertLite — Your Data Export"
-        msg["From"]    = MAIL_FROM # type: ignore
-        msg["To"]      = email
-        msg.attach(MIMEText(body, "plain"))
-
-        with smtplib.SMTP(MAIL_SERVER, MAIL_PORT) as smtp: # type: ignore
-            smtp.starttls()
-            smtp.login(MAIL_FROM, MAIL_PASSWORD) # type: ignore
-            smtp.sendmail(MAIL_FROM, email, msg.as_string()) # type: ignore
-
+        mailer.enqueue(email, "SCMXpertLite — Your Data Export", body)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
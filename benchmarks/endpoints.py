@@ -0,0 +1,187 @@
+# =======================================
+# endpoints.py
+# Micro-benchmarks for the hot read endpoints. Seeds a database, drives
+# the FastAPI app in-process with TestClient and reports ops/s and
+# p50/p99 per endpoint. Results can be saved as a named baseline and
+# later runs compared against it.
+#
+#   python -m benchmarks.endpoints                       # mongomock, default sizes
+#   python -m benchmarks.endpoints --mongo mongodb://localhost:27017
+#   python -m benchmarks.endpoints --save mongomock-small
+#   python -m benchmarks.endpoints --compare mongomock-small
+# =======================================
+
+import argparse
+import json
+import platform
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks import harness
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+ROUTES = ["Chennai", "London", "Berlin", "Tokyo", "Sydney", "Toronto", "Newyork", "Bengaluru"]
+STATUSES = ["active", "in transit", "delivered", "pending", "cancelled"]
+
+
+# ======================================================
+#  SEED
+# ======================================================
+def seed(users: int, shipments: int, readings: int, devices: int):
+    from backend import user, shipments_da, device_data, admin_privileges
+
+    now = datetime.utcnow()
+    user.users.insert_many([{
+        "username": f"user{i}", "email": f"user{i}@example.com", "email_lower": f"user{i}@example.com",
+        "role": "admin" if i == 0 else "user", "firstname": "Bench", "lastname": str(i),
+        "password": "x", "created_at": now - timedelta(days=i % 365),
+    } for i in range(users)])
+
+    rng = random.Random(42)
+    docs = []
+    for i in range(shipments):
+        doc = {
+            "shipment_number": f"{100000 + i}", "container_number": f"CONT{i}", "po_number": f"PO-{i}",
+            "delivery_number": f"DL{i}", "batch_id": f"B{i % 500}", "device_id": str(1150 + i % devices),
+            "route_from": rng.choice(ROUTES), "route_to": rng.choice(ROUTES),
+            "status": rng.choice(STATUSES), "shipment_priority": rng.choice(["high", "medium", "low"]),
+            "shipment_health": rng.choice(["good", "low"]), "goods_type": "Pharma",
+            "created_by": f"user{1 + i % max(users - 1, 1)}", "created_at": now - timedelta(minutes=i),
+        }
+        doc["search_keys"] = shipments_da.build_search_keys(doc)
+        docs.append(doc)
+    if docs:
+        shipments_da.shipments_collection.insert_many(docs)
+
+    device_data.device_data_collection.insert_many([{
+        "Device_ID": 1150 + i % devices, "Battery_Level": round(rng.uniform(2, 5), 2),
+        "First_Sensor_temperature": round(rng.uniform(10, 40), 1),
+        "Route_From": rng.choice(ROUTES), "Route_To": rng.choice(ROUTES),
+        "timestamp": (now - timedelta(seconds=i)).isoformat(),
+    } for i in range(readings)])
+
+    admin_privileges.requests_col.insert_many([{
+        "_id": f"req{i}", "username": f"user{1 + i % max(users - 1, 1)}", "type": "access",
+        "title": f"Request {i}", "status": "pending" if i % 3 else "resolved",
+        "requested_at": now - timedelta(minutes=i),
+    } for i in range(max(users // 2, 1))])
+
+
+# ======================================================
+#  RUN
+# ======================================================
+def endpoints(user_token: str, admin_token: str, backend: str) -> dict:
+    U = {"Authorization": f"Bearer {user_token}"}
+    A = {"Authorization": f"Bearer {admin_token}"}
+    cases = {
+        "GET /user/profile": ("/user/profile", U),
+        "GET /api/shipments": ("/api/shipments", U),
+        "GET /api/shipments/search": ("/api/shipments/search?q=cont1&limit=25", A),
+        "GET /api/shipments/stats": ("/api/shipments/stats", U),
+        "GET /admin/shipments": ("/admin/shipments", A),
+        "GET /admin/shipments ndjson": ("/admin/shipments?format=ndjson", A),
+        "GET /admin/users": ("/admin/users?limit=50", A),
+        "GET /admin/users stream": ("/admin/users?format=stream", A),
+        "GET /admin/pending": ("/admin/pending?limit=50", A),
+        "GET /admin/overview": ("/admin/overview", A),
+        "GET /devices/list": ("/devices/list", U),
+        "GET /device-data/recent": ("/device-data/recent", U),
+        "GET /device-data/{id}": ("/device-data/1151", U),
+        "GET /device-data/{id} ndjson": ("/device-data/1151?format=ndjson", U),
+    }
+    # /user/dashboard counts devices with $unionWith, which mongomock does not implement
+    if backend == "mongod":
+        cases["GET /user/dashboard"] = ("/user/dashboard", U)
+    return cases
+
+
+def run(args) -> dict:
+    backend = harness.use_database(args.mongo)
+
+    from fastapi.testclient import TestClient
+    from backend import main, user
+
+    seed(args.users, args.shipments, args.readings, args.devices)
+    user_token = user.create_token({"username": "user1"})
+    admin_token = user.create_token({"username": "user0", "role": "admin"})
+
+    results = {}
+    with TestClient(main.app) as client:
+        for name, (path, headers) in endpoints(user_token, admin_token, backend).items():
+            if args.only and not any(o in name for o in args.only):
+                continue
+
+            def call():
+                res = client.get(path, headers=headers)
+                if res.status_code != 200:
+                    raise RuntimeError(f"{name} → {res.status_code}: {res.text[:200]}")
+
+            results[name] = harness.measure(call, args.iterations, warmup=args.warmup)
+            r = results[name]
+            print(f"{name:<28} {r['ops_per_s']:>9.1f} ops/s   p50 {r['p50_ms']:>8.2f} ms   p99 {r['p99_ms']:>8.2f} ms")
+
+    return {
+        "meta": {
+            "commit": harness.git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "backend": backend,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "sizes": {"users": args.users, "shipments": args.shipments,
+                      "readings": args.readings, "devices": args.devices},
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Endpoints whose p50 got more than `threshold` slower than the baseline."""
+    regressions = []
+    print(f"\nvs baseline {baseline['meta']['commit']} ({baseline['meta']['backend']}, {baseline['meta']['date']})")
+    for name, now in report["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            print(f"  {name:<28} (new)")
+            continue
+        change = (now["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"  {name:<28} p50 {before['p50_ms']:>8.2f} → {now['p50_ms']:>8.2f} ms ({change:+.0%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpoint micro-benchmarks")
+    parser.add_argument("--mongo", help="mongod URI (default: in-memory mongomock)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--shipments", type=int, default=2000)
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=9)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="substrings of endpoint names to run")
+    parser.add_argument("--save", metavar="NAME", help="store results as baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with baselines/NAME.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save}.json"
+        path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nsaved {path.relative_to(harness.ROOT)}")
+
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# =======================================
+# harness.py
+# Shared pieces for the benchmarks: pointing the backend at a local
+# mongod or an in-memory mongomock stand-in, timing loops and the
+# percentile summary every benchmark prints.
+# =======================================
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def use_database(mongo_uri: str = None, db_app: str = "scmx_bench", db_iot: str = "scmx_bench_iot") -> str:  # type: ignore
+    """
+    Must run before anything from `backend` is imported: backend/db.py builds
+    the one shared MongoClient at import (lazily, connect=False) from
+    MONGO_URI and the database names set here. With no URI that client is a
+    mongomock one (in-memory, no server needed).
+    """
+    os.environ.update(
+        MONGO_DB_APP=db_app, MONGO_DB_IOT=db_iot,
+        SECRET_KEY=os.getenv("SECRET_KEY", "bench-secret"), ALGORITHM="HS256",
+        PBKDF2_WORKERS="0", PBKDF2_ITERATIONS=os.getenv("PBKDF2_ITERATIONS", "1000"),
+        RECAPTCHA_SECRET_KEY="", MAIL_SERVER="localhost", MAIL_PORT="1",
+        MAIL_POLL_INTERVAL="3600",
+    )
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri)
+        client.drop_database(db_app)
+        client.drop_database(db_iot)
+        return "mongod"
+
+    import mongomock
+    import pymongo
+
+    os.environ["MONGO_URI"] = "mongodb://mongomock"
+    shared = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *a, **k: shared  # type: ignore
+    return "mongomock"
+
+
+def measure(fn, iterations: int, warmup: int = 5) -> dict:
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return summarize(samples, elapsed)
+
+
+def percentile(samples: list, p: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[k]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Latencies in seconds → ops/s and millisecond percentiles."""
+    return {
+        "n": len(samples),
+        "ops_per_s": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
@@ -0,0 +1,247 @@
+# =======================================
+# ingest.py
+# End-to-end ingest harness: producer.py → broker → consumer.py → MongoDB
+# → GET /device-data/recent. Every reading carries the producer's send
+# time, so the harness reports sustained msgs/s, send-to-stored and
+# send-to-visible latency percentiles, and consumer lag, for each
+# combination of consumer batch size and partition count.
+#
+#   python -m benchmarks.ingest                           # in-process broker, mongomock
+#   python -m benchmarks.ingest --batch-sizes 1 100 500 --partitions 1 4
+#   python -m benchmarks.ingest --kafka localhost:9092 --mongo mongodb://localhost:27017
+# =======================================
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks import harness
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+Record = namedtuple("Record", "key value")
+
+
+# ======================================================
+#  IN-PROCESS BROKER (stand-in for Kafka)
+# ======================================================
+class MemoryBroker:
+    """Partitioned in-memory log; messages are JSON-encoded like on the wire."""
+
+    def __init__(self, partitions: int):
+        self.partitions = [[] for _ in range(partitions)]
+        self.produced = 0
+        self._cond = threading.Condition()
+
+    def append(self, key, value: bytes):
+        with self._cond:
+            self.partitions[hash(key) % len(self.partitions)].append(Record(key, value))
+            self.produced += 1
+            self._cond.notify_all()
+
+
+class MemoryProducer:
+    def __init__(self, broker: MemoryBroker):
+        self.broker = broker
+
+    def send(self, topic, key=None, value=None):
+        self.broker.append(key, json.dumps(value).encode("utf-8"))
+
+    def flush(self):
+        pass
+
+
+class MemoryConsumer:
+    """Reads its assigned partitions; poll() mirrors KafkaConsumer.poll()."""
+
+    def __init__(self, broker: MemoryBroker, assigned: list):
+        self.broker = broker
+        self.offsets = {p: 0 for p in assigned}
+
+    def _ready(self) -> bool:
+        return any(len(self.broker.partitions[p]) > o for p, o in self.offsets.items())
+
+    def poll(self, timeout_ms=0, max_records=500):
+        with self.broker._cond:
+            if not self._ready():
+                self.broker._cond.wait(timeout_ms / 1000)
+            out = {}
+            budget = max_records
+            for p, offset in self.offsets.items():
+                if budget <= 0:
+                    break
+                log = self.broker.partitions[p]
+                chunk = log[offset:offset + budget]
+                if chunk:
+                    self.offsets[p] = offset + len(chunk)
+                    budget -= len(chunk)
+                    out[p] = [Record(r.key, json.loads(r.value)) for r in chunk]
+            return out
+
+
+def memory_transport(partitions: int, consumers: int):
+    broker = MemoryBroker(partitions)
+    groups = [list(range(i, partitions, consumers)) for i in range(consumers)]
+    return MemoryProducer(broker), [MemoryConsumer(broker, g) for g in groups]
+
+
+def kafka_transport(bootstrap: str, partitions: int, consumers: int):
+    import consumer as consumer_mod
+    import producer as producer_mod
+    from kafka.admin import KafkaAdminClient, NewTopic
+
+    topic = f"ingest-bench-{uuid.uuid4().hex[:8]}"
+    KafkaAdminClient(bootstrap_servers=bootstrap).create_topics(
+        [NewTopic(topic, num_partitions=partitions, replication_factor=1)])
+
+    producer_mod.TOPIC = topic
+    prod = producer_mod.connect_producer(bootstrap, linger_ms=5)
+    cons = [consumer_mod.connect_consumer(bootstrap, topic, group_id=f"{topic}-group",
+                                          auto_offset_reset="earliest") for _ in range(consumers)]
+    return prod, cons
+
+
+# ======================================================
+#  ONE RUN
+# ======================================================
+def run_once(args, batch_size: int, partitions: int, collection, client) -> dict:
+    import consumer as consumer_mod
+    import producer as producer_mod
+
+    collection.delete_many({})
+    consumers = min(args.consumers or partitions, partitions)
+    if args.kafka:
+        prod, cons = kafka_transport(args.kafka, partitions, consumers)
+    else:
+        prod, cons = memory_transport(partitions, consumers)
+
+    stored_latencies, visible_latencies, lag_samples = [], [], []
+    stored = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+    sent = [0]
+
+    def on_batch(docs):
+        now = time.time()
+        with lock:
+            stored[0] += len(docs)
+            stored_latencies.extend(now - d["Timestamp"] for d in docs)
+            if stored[0] >= args.messages:
+                done.set()
+
+    consumer_threads = [threading.Thread(
+        target=consumer_mod.consume, args=(c, collection),
+        kwargs={"batch_size": batch_size, "should_stop": done.is_set, "on_batch": on_batch},
+        daemon=True) for c in cons]
+
+    def sample_lag():
+        while not done.wait(args.sample_interval):
+            with lock:
+                lag_samples.append(sent[0] - stored[0])
+
+    def watch_api():
+        seen = set()
+        while not done.is_set():
+            t0 = time.time()
+            res = client.get("/device-data/recent")
+            for r in res.json().get("records", []):
+                ts = r.get("timestamp")
+                if ts and ts not in seen:
+                    seen.add(ts)
+                    visible_latencies.append(time.time() - datetime.fromisoformat(ts).timestamp())
+            time.sleep(max(args.api_interval - (time.time() - t0), 0))
+
+    class Counting:
+        """Wraps the producer to count sends for the lag sampler."""
+        def send(self, *a, **k):
+            prod.send(*a, **k)
+            sent[0] += 1
+
+        def flush(self):
+            prod.flush()
+
+    for t in consumer_threads:
+        t.start()
+    helpers = [threading.Thread(target=sample_lag, daemon=True)]
+    if not args.no_api:
+        helpers.append(threading.Thread(target=watch_api, daemon=True))
+    for t in helpers:
+        t.start()
+
+    start = time.time()
+    interval = 1 / args.rate if args.rate else 0
+    producer_mod.run(Counting(), interval=interval, count=args.messages, verbose=False)
+    finished = done.wait(args.timeout)
+    elapsed = time.time() - start
+    done.set()
+    for t in consumer_threads + helpers:
+        t.join(5)
+
+    result = {
+        "batch_size": batch_size,
+        "partitions": partitions,
+        "consumers": consumers,
+        "messages": stored[0],
+        "complete": finished,
+        "msgs_per_s": round(stored[0] / elapsed, 1) if elapsed else 0.0,
+        "stored_p50_ms": round(harness.percentile(stored_latencies, 50) * 1000, 2),
+        "stored_p99_ms": round(harness.percentile(stored_latencies, 99) * 1000, 2),
+        "visible_p50_ms": round(harness.percentile(visible_latencies, 50) * 1000, 2),
+        "visible_p99_ms": round(harness.percentile(visible_latencies, 99) * 1000, 2),
+        "max_lag": max(lag_samples, default=0),
+        "mean_lag": round(sum(lag_samples) / len(lag_samples), 1) if lag_samples else 0.0,
+    }
+    print(f"batch {batch_size:>5}  partitions {partitions:>2}  {result['msgs_per_s']:>9.1f} msg/s   "
+          f"stored p50 {result['stored_p50_ms']:>8.2f} p99 {result['stored_p99_ms']:>8.2f} ms   "
+          f"visible p50 {result['visible_p50_ms']:>8.2f} ms   max lag {result['max_lag']:>6}"
+          + ("" if finished else "   (timed out)"))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ingest harness")
+    parser.add_argument("--kafka", metavar="BOOTSTRAP", help="real broker (default: in-process stand-in)")
+    parser.add_argument("--mongo", help="mongod URI (default: in-memory mongomock)")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=0, help="producer msgs/s (0 = as fast as possible)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--consumers", type=int, help="consumer threads (default: one per partition)")
+    parser.add_argument("--sample-interval", type=float, default=0.05, help="lag sampling period (s)")
+    parser.add_argument("--api-interval", type=float, default=0.1, help="/device-data/recent poll period (s)")
+    parser.add_argument("--no-api", action="store_true", help="skip the /device-data/recent watcher")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--save", metavar="NAME", help="store results as baselines/ingest-NAME.json")
+    args = parser.parse_args()
+
+    backend = harness.use_database(args.mongo)
+    # consumer.py reads its target database from the environment at import
+    import consumer as consumer_mod
+    from fastapi.testclient import TestClient
+    from backend import main as app_main
+
+    collection = consumer_mod.get_collection()
+    results = []
+    with TestClient(app_main.app) as client:
+        for partitions in args.partitions:
+            for batch_size in args.batch_sizes:
+                results.append(run_once(args, batch_size, partitions, collection, client))
+
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"ingest-{args.save}.json"
+        path.write_text(json.dumps({
+            "meta": {"commit": harness.git_commit(), "date": datetime.utcnow().isoformat(timespec="seconds"),
+                     "backend": backend, "broker": "kafka" if args.kafka else "memory",
+                     "messages": args.messages, "rate": args.rate},
+            "results": results,
+        }, indent=2) + "\n")
+        print(f"\nsaved {path.relative_to(harness.ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
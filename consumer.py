@@ -1,54 +1,163 @@
 #consumer.py
-from kafka import KafkaConsumer
 from pymongo import MongoClient
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 import json
 import os
 from dotenv import load_dotenv
+import signal
 import time
+import tracemalloc
+from datetime import datetime, timezone
 load_dotenv()
 
-
-import os
-from kafka.errors import NoBrokersAvailable
-
 # Bootstrap servers: use environment variable or default to the compose service name
 BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
+TOPIC = os.getenv('KAFKA_TOPIC', 'test_topic')
+GROUP_ID = os.getenv('KAFKA_GROUP_ID', 'sensor-ingest')
 
-# Create Kafka consumer with retry loop while broker starts
-consumer = None
-attempt = 0
-while True:
-    try:
-        consumer = KafkaConsumer(
-            'test_topic',
-            bootstrap_servers=BOOTSTRAP_SERVERS,
-            value_deserializer=lambda m: json.loads(m.decode('utf-8'))
-        )
-        print(f"Connected to Kafka brokers at {BOOTSTRAP_SERVERS}")
-        break
-    except NoBrokersAvailable:
-        attempt += 1
-        wait = min(2 * attempt, 30)
-        print(f"Kafka brokers not available yet (attempt {attempt}). Retrying in {wait}s...")
-        time.sleep(wait)
+# Readings are written with one insert_many per poll of up to BATCH_SIZE messages
+BATCH_SIZE = int(os.getenv('CONSUMER_BATCH_SIZE', '500'))
+POLL_TIMEOUT_MS = int(os.getenv('CONSUMER_POLL_TIMEOUT_MS', '1000'))
 
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client.iot_data
-collection = db.sensor_readings
-MONGO_URI = os.getenv("MONGO_URI")
-MONGO_DB = os.getenv("MONGO_DB_IOT")
+MONGO_DB = os.getenv("MONGO_DB_IOT", "iot_data")
+# Prometheus scrape port; 0 disables the endpoint
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9102'))
+
+CONSUMED = Counter('consumer_messages_consumed_total', 'Readings stored in MongoDB')
+BATCH_SIZES = Histogram('consumer_batch_size', 'Readings per insert_many',
+                        buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+WRITE_LATENCY = Histogram('consumer_write_duration_seconds', 'insert_many latency',
+                          buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+# tracemalloc: 0 frames = off. Snapshots are taken every TRACEMALLOC_INTERVAL
+# seconds (0 = only on SIGUSR1), written to TRACEMALLOC_DIR and logged as
+# the top allocation growth since the previous snapshot.
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', '0'))
+TRACEMALLOC_INTERVAL = float(os.getenv('TRACEMALLOC_INTERVAL', '0'))
+TRACEMALLOC_DIR = os.getenv('TRACEMALLOC_DIR', 'snapshots')
+
+LAG = Gauge('consumer_lag_messages', 'Messages behind the partition high-water mark', ['partition'])
+
+
+def connect_consumer(bootstrap_servers=BOOTSTRAP_SERVERS, topic=TOPIC, group_id=GROUP_ID, **config):
+    """Create a Kafka consumer, retrying while the broker is starting."""
+    from kafka import KafkaConsumer
+    from kafka.errors import NoBrokersAvailable
+
+    attempt = 0
+    while True:
+        try:
+            consumer = KafkaConsumer(
+                topic,
+                bootstrap_servers=bootstrap_servers,
+                group_id=group_id,
+                value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+                **config
+            )
+            print(f"Connected to Kafka brokers at {bootstrap_servers}")
+            return consumer
+        except NoBrokersAvailable:
+            attempt += 1
+            wait = min(2 * attempt, 30)
+            print(f"Kafka brokers not available yet (attempt {attempt}). Retrying in {wait}s...")
+            time.sleep(wait)
+
+
+def get_collection(mongo_uri=MONGO_URI, db_name=MONGO_DB):
+    # Main IoT collection (the one /device-data reads)
+    return MongoClient(mongo_uri)[db_name]["sensor_readings"]
+
+
+class MemorySnapshots:
+    def __init__(self, interval=TRACEMALLOC_INTERVAL, out_dir=TRACEMALLOC_DIR, top=10):
+        self.interval = interval
+        self.out_dir = out_dir
+        self.top = top
+        self.previous = None
+        self.requested = False
+        self.last = time.monotonic()
+
+    def install(self, frames=TRACEMALLOC_FRAMES):
+        tracemalloc.start(frames)
+        if hasattr(signal, 'SIGUSR1'):
+            # only set a flag here; the snapshot is taken between polls
+            signal.signal(signal.SIGUSR1, lambda *_: setattr(self, 'requested', True))
+        print(f"tracemalloc on ({frames} frames); kill -USR1 {os.getpid()} for a snapshot")
+
+    def maybe_take(self):
+        due = self.interval and time.monotonic() - self.last >= self.interval
+        if not (self.requested or due):
+            return
+        self.requested = False
+        self.last = time.monotonic()
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"consumer-{os.getpid()}-{int(time.time())}.snap")
+        snapshot.dump(path)
+
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"tracemalloc: {current / 1e6:.1f} MB traced (peak {peak / 1e6:.1f} MB), saved {path}")
+        if self.previous is not None:
+            stats = snapshot.compare_to(self.previous, 'lineno')
+        else:
+            stats = snapshot.statistics('lineno')
+        for stat in stats[:self.top]:
+            print(f"  {stat}")
+        self.previous = snapshot
+
+
+def record_lag(consumer, polled):
+    # highwater() is only known once the client has fetched from the partition
+    if not hasattr(consumer, "highwater"):
+        return
+    for tp in polled:
+        highwater = consumer.highwater(tp)
+        if highwater is not None:
+            LAG.labels(str(tp.partition)).set(highwater - consumer.position(tp))
+
+
+def consume(consumer, collection, batch_size=BATCH_SIZE, should_stop=lambda: False, on_batch=None,
+            snapshots=None):
+    """Poll and store readings until should_stop() is true. Returns the number stored."""
+    stored = 0
+    while not should_stop():
+        if snapshots:
+            snapshots.maybe_take()
+        polled = consumer.poll(timeout_ms=POLL_TIMEOUT_MS, max_records=batch_size)
+        docs = [record.value for records in polled.values() for record in records]
+        if not docs:
+            continue
 
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB] # type: ignore
+        ingested_at = datetime.now(timezone.utc)
+        for doc in docs:
+            doc["ingested_at"] = ingested_at
+            # /device-data sorts on the ISO `timestamp` the API writes; give sensor readings one too
+            if "timestamp" not in doc and isinstance(doc.get("Timestamp"), (int, float)):
+                doc["timestamp"] = datetime.fromtimestamp(doc["Timestamp"], timezone.utc).isoformat()
+        start = time.perf_counter()
+        collection.insert_many(docs, ordered=False)
+        WRITE_LATENCY.observe(time.perf_counter() - start)
+        BATCH_SIZES.observe(len(docs))
+        CONSUMED.inc(len(docs))
+        stored += len(docs)
+        record_lag(consumer, polled)
 
-# Main IoT collection
-device_data_collection = db["sensor_readings"]
+        if on_batch:
+            on_batch(docs)
+        else:
+            print(f"Inserted {len(docs)} readings into MongoDB")
+    return stored
 
-print("Kafka consumer started. Waiting for messages...")
 
-for message in consumer:
-    data = message.value
-    device_data_collection.insert_one(data)
-    collection.insert_one(data)
-    print(f"Inserted into MongoDB: {data}")
\ No newline at end of file
+if __name__ == "__main__":
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    snapshots = None
+    if TRACEMALLOC_FRAMES:
+        snapshots = MemorySnapshots()
+        snapshots.install()
+    consumer = connect_consumer()
+    print("Kafka consumer started. Waiting for messages...")
+    consume(consumer, get_collection(), snapshots=snapshots)
@@ -1,50 +1,91 @@
-from kafka import KafkaProducer
+#producer.py
 import json
 import time
 import random
 
 import os
-from kafka.errors import NoBrokersAvailable
+
+from prometheus_client import Counter, start_http_server
 
 # Bootstrap servers: use environment variable or default to the compose service name
 BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
+TOPIC = os.getenv('KAFKA_TOPIC', 'test_topic')
+# seconds between readings; 0 sends as fast as the broker accepts them
+SEND_INTERVAL = float(os.getenv('PRODUCER_INTERVAL', '10'))
+# Prometheus scrape port; 0 disables the endpoint
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9101'))
 
-# Create Kafka producer with a retry loop while broker is starting
-producer = None
-attempt = 0
-while True:
-    try:
-        producer = KafkaProducer(
-            bootstrap_servers=BOOTSTRAP_SERVERS,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
-        )
-        print(f"Connected to Kafka brokers at {BOOTSTRAP_SERVERS}")
-        break
-    except NoBrokersAvailable:
-        attempt += 1
-        wait = min(2 * attempt, 30)
-        print(f"Kafka brokers not available yet (attempt {attempt}). Retrying in {wait}s...")
-        time.sleep(wait)
+SENT = Counter('producer_messages_sent_total', 'Readings handed to the Kafka client')
+SEND_ERRORS = Counter('producer_send_errors_total', 'Readings the Kafka client rejected')
 
 route = ['Newyork,USA', 'Chennai, India', 'Bengaluru, India', 'London,UK', 'Berlin, Germany', 'Tokyo, Japan', 'Sydney, Australia', 'Toronto, Canada']
 
-while True:
-    routefrom = random.choice(route)
-    routeto = random.choice(route)
-
-    if routefrom != routeto:
-        data = {
-            "Battery_Level": round(random.uniform(2.0, 5.0), 2),
-            "Device_ID": random.randint(1150, 1158),
-            "First_Sensor_temperature": round(random.uniform(10, 40.0), 1),
-            "Route_From": routefrom,
-            "Route_To": routeto,
-            "Timestamp": time.time()
-        }
-
-        # send to Kafka topic 'test_topic'
-        producer.send('test_topic', value=data)
-        producer.flush()   # optional, but good while debugging
-
-        print(f"Sent to Kafka: {data}")
-        time.sleep(10)
\ No newline at end of file
+
+def connect_producer(bootstrap_servers=BOOTSTRAP_SERVERS, **config):
+    """Create a Kafka producer, retrying while the broker is starting."""
+    from kafka import KafkaProducer
+    from kafka.errors import NoBrokersAvailable
+
+    attempt = 0
+    while True:
+        try:
+            producer = KafkaProducer(
+                bootstrap_servers=bootstrap_servers,
+                value_serializer=lambda v: json.dumps(v).encode('utf-8'),
+                key_serializer=lambda k: str(k).encode('utf-8'),
+                **config
+            )
+            print(f"Connected to Kafka brokers at {bootstrap_servers}")
+            return producer
+        except NoBrokersAvailable:
+            attempt += 1
+            wait = min(2 * attempt, 30)
+            print(f"Kafka brokers not available yet (attempt {attempt}). Retrying in {wait}s...")
+            time.sleep(wait)
+
+
+def make_reading(rng=random):
+    routefrom = rng.choice(route)
+    routeto = rng.choice(route)
+    while routeto == routefrom:
+        routeto = rng.choice(route)
+
+    return {
+        "Battery_Level": round(rng.uniform(2.0, 5.0), 2),
+        "Device_ID": rng.randint(1150, 1158),
+        "First_Sensor_temperature": round(rng.uniform(10, 40.0), 1),
+        "Route_From": routefrom,
+        "Route_To": routeto,
+        "Timestamp": time.time()
+    }
+
+
+def run(producer, interval=SEND_INTERVAL, count=None, topic=TOPIC, verbose=True):
+    """Send readings until `count` have gone out (forever when None). Returns the number sent."""
+    sent = 0
+    try:
+        while count is None or sent < count:
+            data = make_reading()
+            # keyed by device so one device's readings stay ordered within a partition
+            try:
+                producer.send(topic, key=data["Device_ID"], value=data)
+            except Exception:
+                SEND_ERRORS.inc()
+                raise
+            SENT.inc()
+            sent += 1
+
+            if interval > 0:
+                producer.flush()
+                if verbose:
+                    print(f"Sent to Kafka: {data}")
+                time.sleep(interval)
+    finally:
+        producer.flush()
+    return sent
+
+
+if __name__ == "__main__":
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    run(connect_producer())